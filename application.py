@@ -1,277 +1,295 @@
-# pylint: disable=C0103,E0401,R0913,C0330,too-many-locals
+# pylint: disable=C0103,E0401
 """
 JFSP app.
 
 See gui.py for the Dash components and GUI.
+See figures.py for the figures drawn by the callbacks.
 See luts.py for the lookup tables which drive both the data ingest and GUI.
 See preprocess.py for the data structure that this code assumes!
 
 """
 import os
-import math
-import plotly.graph_objs as go
-from dash.dependencies import Input, Output
+import time
+import hashlib
+from functools import wraps
+from dash.dependencies import ClientsideFunction, Input, Output
 import dash
-import pandas as pd
+import data
+import figures
 import luts
+import metrics
+import payload
+import bundle
+from cache import FigureCache, PrecomputedFigures, SharedCache
+from responses import ResponseCache
 from gui import layout
 
-total_area_burned = pd.read_pickle("total_area_burned.pickle")
-veg_counts = pd.read_pickle("veg_counts.pickle")
-costs = pd.read_pickle("costs.pickle")
-
-# Window for doing rolling average/std
-rolling_window = 10
+# Figures shared by all callbacks, see cache.py.  Optionally
+# capped by total serialized size (bytes) as well as entry count.
+figure_cache = FigureCache(
+    max_entries=int(os.environ.get("FIGURE_CACHE_SIZE", 2048)),
+    max_bytes=int(os.environ["FIGURE_CACHE_BYTES"])
+    if "FIGURE_CACHE_BYTES" in os.environ
+    else None,
+)
 
-app = dash.Dash(__name__)
+# Figures for the whole input space, if preprocess.py has produced them.
+precomputed = PrecomputedFigures("figures.json.gz")
+
+# Send slimmed figures (precomputed box statistics, typed arrays
+# where supported), see payload.py.
+slim_figures = bool(os.environ.get("SLIM_FIGURES"))
+
+# Draw the region figures (area burned, replicate spread, inter-annual
+# variability, veg counts) from one multi-output callback, so a change
+# of region, scenario or treatments costs one request rather than four.
+combined_callback = bool(os.environ.get("COMBINED_CALLBACK"))
+
+# Draw every figure in the browser (assets/clientside.js) from a data
+# bundle fetched once, see bundle.py.  The server callbacks are only
+# registered without it.
+clientside = bool(os.environ.get("CLIENTSIDE"))
+
+
+def serve(builder):
+    """
+    Serve a figure builder's output from the precomputed figures
+    when available, otherwise build it (through the figure cache).
+    Slimmed if SLIM_FIGURES is set.
+    """
+    memoized = figure_cache.memoize(metrics.instrument(builder))
+
+    @metrics.timed_callback
+    @wraps(builder)
+    def wrapper(*args):
+        figure = precomputed.get(builder.__name__, args)
+        if figure is None:
+            if len(precomputed):
+                metrics.registry.inc("jfsp_cache_misses_total", cache="precomputed")
+            figure = memoized(*args)
+        else:
+            metrics.registry.inc("jfsp_cache_hits_total", cache="precomputed")
+        if slim_figures:
+            figure = payload.slim(figure)
+        return figure
+
+    return wrapper
+
+
+# Dash 2 only gzips responses (with Flask-Compress) when asked to.
 app = dash.Dash(
-    __name__, requests_pathname_prefix=os.environ["REQUESTS_PATHNAME_PREFIX"]
+    __name__,
+    requests_pathname_prefix=os.environ["REQUESTS_PATHNAME_PREFIX"],
+    compress=True,
 )
 
 # AWS Elastic Beanstalk looks for application by default,
 # if this variable (application) isn't set you will get a WSGI error.
 application = app.server
 
-app.title = "Alaska Wildfire Management - Possible Futures"
-app.layout = layout
-
-@app.callback(
-    Output("total_area_burned", "figure"),
-    inputs=[
-        Input("region", "value"),
-        Input("scenarios_checklist", "value"),
-        Input("treatment_options_checklist", "value"),
-    ],
+# Callback timings and cache counters at /metrics, see metrics.py.
+# Installed first, so requests the response cache answers are timed too.
+metrics.init_app(application)
+
+
+def cache_namespace():
+    """
+    Prefix for the shared cache keys.  The database outlives restarts and
+    redeploys, so this covers what the responses depend on besides the
+    request: the modes set here, the Dash version, the size and mtime of
+    the tables and precomputed figures, and the code drawing the figures.
+    """
+    version = hashlib.sha256()
+    version.update(repr((slim_figures, combined_callback, dash.__version__)).encode())
+    paths = [precomputed.path]
+    for name in sorted(data.sources):
+        paths.append(name + ".pickle")
+        columns = name + ".columns"
+        if os.path.isdir(columns):
+            paths += [os.path.join(columns, f) for f in sorted(os.listdir(columns))]
+    for path in paths:
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            version.update(repr((path, stat.st_size, stat.st_mtime_ns)).encode())
+    for module in (figures, payload, luts):
+        with open(module.__file__, "rb") as source:
+            version.update(source.read())
+    return version.hexdigest()[:16] + ":"
+
+
+# Optionally, responses shared by all of the server's worker processes
+# through an SQLite database on local disk, see cache.py.
+shared_cache = (
+    SharedCache(
+        os.environ["SHARED_CACHE_PATH"],
+        ttl=float(os.environ.get("SHARED_CACHE_TTL", 24 * 3600)),
+        max_bytes=int(os.environ.get("SHARED_CACHE_BYTES", 256 * 2**20)),
+        namespace=cache_namespace(),
+    )
+    if os.environ.get("SHARED_CACHE_PATH")
+    else None
 )
-def generate_total_area_burned(region, scenario, treatment_options):
-    """ Regenerate plot data for area burned """
-    data_traces = []
-
-    # Subset historical data
-    h = total_area_burned[
-        (total_area_burned.region == region)
-        & (total_area_burned.treatment == luts.historical_categories[1])
-    ]
 
-    # For each trace, draw a box plot but don't repeat the
-    # plots for historical stuff.  Use a counter to decide
-    # if to trim the data set.
-    counter = 0
-    for treatment in treatment_options:
-        dt = pd.DataFrame()
-        t = total_area_burned[
-            (total_area_burned.region == region)
-            & (total_area_burned.scenario == scenario)
-            & (total_area_burned.model == luts.MODEL_AVG)
-            & (total_area_burned.treatment == treatment)
+# Serialized, precompressed callback responses, see responses.py.
+response_cache = ResponseCache(
+    max_entries=int(os.environ.get("RESPONSE_CACHE_SIZE", 2048)),
+    max_bytes=int(os.environ["RESPONSE_CACHE_BYTES"])
+    if "RESPONSE_CACHE_BYTES" in os.environ
+    else None,
+    shared=shared_cache,
+)
+response_cache.init_app(application)
+
+
+@metrics.registry.collector
+def cache_metrics():
+    """ Cache counters and table load times, read at each scrape """
+    samples = []
+    caches = [("figure", figure_cache), ("response", response_cache)]
+    if shared_cache is not None:
+        caches.append(("shared", shared_cache))
+    for name, cache in caches:
+        stats = cache.stats()
+        samples += [
+            ("jfsp_cache_hits_total", "counter", {"cache": name}, stats["hits"]),
+            ("jfsp_cache_misses_total", "counter", {"cache": name}, stats["misses"]),
+            ("jfsp_cache_entries", "gauge", {"cache": name}, stats["entries"]),
+            ("jfsp_cache_bytes", "gauge", {"cache": name}, stats["bytes"]),
         ]
-
-        t = t.append(h)
-        if counter > 0:
-            t["year"] = pd.to_numeric(t.index)
-            t = t[(t.year >= 2010) & (t.year <= 2100)]
-
-        # Trick to group the data into decadal buckets,
-        # to match what Dash wants for box plots.
-        t = t.groupby(t.index // 10 * 10)
-        for key, values in t:  # pylint: disable=unused-variable
-            a = t.get_group(key)
-            a = a.assign(decade=key)
-            dt = dt.append(a)
-
-        data_traces.extend(
-            [
-                go.Box(
-                    name="Area burned, " + luts.treatment_options[treatment],
-                    x=dt.decade,
-                    y=dt.area.apply(luts.to_acres),
-                )
-            ]
-        )
-        counter += 1
-
-    graph_layout = go.Layout(
-        title="Total area burned, "
-        + luts.regions[region]
-        + ", "
-        + luts.scenarios[scenario]
-        + ", "
-        + luts.models[luts.MODEL_AVG],
-        showlegend=True,
-        legend_orientation="h",
-        boxmode="group",
-        legend={"font": {"family": "Open Sans", "size": 10}, "y": -0.15},
-        xaxis={"title": "Year"},
-        yaxis={"title": "Acres", "range": [0, 1900000]},
-        height=550,
-        margin={"l": 50, "r": 50, "b": 50, "t": 50, "pad": 4},
-    )
-    return {"data": data_traces, "layout": graph_layout}
+    samples += [
+        ("jfsp_table_load_seconds", "gauge", {"table": name}, seconds)
+        for name, seconds in data.load_times().items()
+    ]
+    return samples
 
 
-@app.callback(
-    Output("ia", "figure"),
-    inputs=[
-        Input("region", "value"),
-        Input("scenarios_checklist", "value"),
-        Input("treatment_options_checklist", "value"),
-    ],
-)
-def generate_ia(region, scenario, treatment_options):
-    """ Regenerate plot data for area burned """
-    data_traces = []
-
-    for treatment in treatment_options:
-        t = total_area_burned[
-            (total_area_burned.region == region)
-            & (total_area_burned.scenario == scenario)
-            & (total_area_burned.model == luts.MODEL_AVG)
-            & (total_area_burned.treatment == treatment)
-        ]
+app.title = "Alaska Wildfire Management - Possible Futures"
+app.layout = layout
 
-        # Always merge the historical data for computing the
-        # rolling std so we get meaningful results for the 2010s.
-        rolling_std = t.area.rolling(rolling_window, center=True).std()
-        rolling_std = rolling_std.loc[2019:2095]
-
-        data_traces.extend(
-            [
-                {
-                    "x": rolling_std.index.tolist(),
-                    "y": rolling_std.apply(luts.to_acres),
-                    "type": "line",
-                    "name": ", ".join(
-                        [
-                            "10-year rolling standard deviation, "
-                            + luts.treatment_options[treatment]
-                        ]
-                    ),
-                },
-            ]
+region_inputs = [
+    Input("region", "value"),
+    Input("scenarios_checklist", "value"),
+    Input("treatment_options_checklist", "value"),
+]
+
+cost_inputs = [
+    Input("scenarios_checklist", "value"),
+    Input("treatment_options_checklist", "value"),
+    Input("fmo_radio", "value"),
+]
+
+if clientside:
+    data_bundle = bundle.Bundle()
+
+    @application.route(app.config.routes_pathname_prefix + "data-bundle.json")
+    def serve_data_bundle():
+        """ The data bundle for the clientside figures """
+        return data_bundle.response()
+
+    for graph, inputs in [
+        ("total_area_burned", region_inputs),
+        ("replicate_spread", region_inputs),
+        ("ia", region_inputs + [Input("rolling_window_radio", "value")]),
+        ("veg_counts", region_inputs),
+        ("costs", cost_inputs),
+    ]:
+        app.clientside_callback(
+            ClientsideFunction(namespace="jfsp", function_name=graph),
+            Output(graph, "figure"),
+            inputs,
         )
 
-    graph_layout = go.Layout(
-        title="Inter-annual variability, "
-        + luts.regions[region]
-        + ", "
-        + luts.scenarios[scenario]
-        + ", "
-        + luts.models[luts.MODEL_AVG],
-        showlegend=True,
-        legend_orientation="h",
-        boxmode="group",
-        legend={"font": {"family": "Open Sans", "size": 10}, "y": -0.15},
-        xaxis={"title": "Year"},
-        yaxis={"title": "Acres"},
-        height=550,
-        margin={"l": 50, "r": 50, "b": 50, "t": 50, "pad": 4},
-    )
-    return {"data": data_traces, "layout": graph_layout}
+elif combined_callback:
+    # One request returns every figure that depends on the region inputs.
+    region_builders = [
+        ("total_area_burned", serve(figures.generate_total_area_burned)),
+        ("replicate_spread", serve(figures.generate_replicate_spread)),
+        ("ia", serve(figures.generate_ia)),
+        ("veg_counts", serve(figures.generate_veg_counts)),
+    ]
 
+    region_outputs = [Output(graph, "figure") for graph, _ in region_builders]
 
-@app.callback(
-    Output("veg_counts", "figure"),
-    inputs=[
-        Input("region", "value"),
-        Input("scenarios_checklist", "value"),
-        Input("treatment_options_checklist", "value"),
-    ],
-)
-def generate_veg_counts(region, scenario, treatment_options):
-    """ Display veg count graph """
-    data_traces = []
-
-    # Future!
-    for treatment in treatment_options:
-        vc = veg_counts.loc[
-            (veg_counts["treatment"] == treatment)
-            & (veg_counts["scenario"] == scenario)
-            & (veg_counts["model"] == luts.MODEL_AVG)
-            & (veg_counts["region"] == region)
-        ]
-        data_traces.extend(
-            [
-                {
-                    "x": vc.index.tolist(),
-                    "y": vc["coniferous"] / vc["deciduous"],
-                    "type": "line",
-                    "name": ", ".join(
-                        [
-                            luts.treatment_options[treatment],
-                            luts.scenarios[scenario],
-                            luts.models[luts.MODEL_AVG],
-                        ]
-                    ),
-                }
-            ]
-        )
+    # Only the inter-annual variability figure depends on these.
+    window_inputs = {"rolling_window_radio.value"}
 
-    graph_layout = go.Layout(
-        title="Ratio of Coniferous to Deciduous, by area, "
-        + luts.regions[region]
-        + ", "
-        + luts.scenarios[scenario]
-        + ", "
-        + luts.models[luts.MODEL_AVG],
-        showlegend=True,
-        legend={"font": {"family": "Open Sans", "size": 10}, "y": -0.15},
-        xaxis={"title": "Year"},
-        height=550,
-        legend_orientation="h",
-        yaxis={"title": "Coniferous/Deciduous"},
-        margin={"l": 50, "r": 50, "b": 50, "t": 50, "pad": 4},
+    @app.callback(
+        region_outputs,
+        inputs=region_inputs + [Input("rolling_window_radio", "value")],
+    )
+    def generate_region_figures(region, scenario, treatment_options, window):
+        """
+        All of the region figures, for one change of the inputs.  Only the
+        inter-annual variability figure depends on the rolling window, so
+        a change of the window alone leaves the others as they are.
+        """
+        triggered = {item["prop_id"] for item in dash.callback_context.triggered}
+        window_only = triggered == window_inputs
+        args = (region, scenario, treatment_options)
+        result = []
+        for graph, builder in region_builders:
+            if graph == "ia":
+                result.append(builder(*args, window))
+            elif window_only:
+                result.append(dash.no_update)
+            else:
+                result.append(builder(*args))
+        return result
+
+    # A change of the window alone gets a different response than any
+    # other change with the same values, so the response cache keys on it.
+    response_cache.partial_outputs[
+        "..{}..".format("...".join(str(output) for output in region_outputs))
+    ] = window_inputs
+
+
+else:
+    generate_total_area_burned = app.callback(
+        Output("total_area_burned", "figure"), inputs=region_inputs
+    )(serve(figures.generate_total_area_burned))
+
+    generate_replicate_spread = app.callback(
+        Output("replicate_spread", "figure"), inputs=region_inputs
+    )(serve(figures.generate_replicate_spread))
+
+    generate_ia = app.callback(
+        Output("ia", "figure"),
+        inputs=region_inputs + [Input("rolling_window_radio", "value")],
+    )(serve(figures.generate_ia))
+
+    generate_veg_counts = app.callback(
+        Output("veg_counts", "figure"), inputs=region_inputs
+    )(serve(figures.generate_veg_counts))
+
+if not clientside:
+    generate_costs = app.callback(Output("costs", "figure"), inputs=cost_inputs)(
+        serve(figures.generate_costs)
     )
-    return {"data": data_traces, "layout": graph_layout}
-
 
-@app.callback(
-    Output("costs", "figure"),
-    inputs=[
-        Input("scenarios_checklist", "value"),
-        Input("treatment_options_checklist", "value"),
-        Input("fmo_radio", "value"),
-    ],
-)
-def generate_costs(scenario, treatment_options, option):
-    """ Generate costs graph """
-    data_traces = []
-
-    for treatment in treatment_options:
-        dt = pd.DataFrame()
-        hc = costs.loc[
-            (costs["treatment"] == treatment)
-            & (costs["scenario"] == scenario)
-            & (costs["model"] == luts.MODEL_AVG)
-            & (costs["option"] == option)
-        ]
-        hc = hc.groupby(hc.index // 10 * 10)
 
-        for key, values in hc:  # pylint: disable=unused-variable
-            d = hc.get_group(key)
-            d = d.assign(decade=key)
-            dt = dt.append(d)
+def preload():
+    """
+    Load the data the callbacks use now rather than on first use, and
+    report how long that took.  Call before a server forks its workers
+    so they share the loaded data.
+    """
+    times = data.preload()
+    precomputed.load()
+    times["precomputed figures"] = precomputed.load_seconds
+    if clientside:
+        start = time.perf_counter()
+        data_bundle.load()
+        times["data bundle"] = time.perf_counter() - start
+    print(
+        "Preloaded data in {:.2f}s: ".format(sum(times.values()))
+        + ", ".join("{} {:.2f}s".format(name, secs) for name, secs in times.items())
+    )
+    return times
 
-        data_traces.extend(
-            [go.Box(name=luts.treatment_options[treatment], x=dt.decade, y=dt.cost)]
-        )
 
-    if option == "total":
-        title_option = "Total Costs"
-    else:
-        title_option = luts.fmo_options[option] + " Option"
-
-    graph_layout = go.Layout(
-        title="Future Costs, Full Model Domain, " + title_option,
-        showlegend=True,
-        height=550,
-        legend_orientation="h",
-        boxmode="group",
-        legend={"font": {"family": "Open Sans", "size": 10}, "y": -0.15},
-        xaxis={"title": "Year"},
-        yaxis={"title": "Cost ($)"},
-        margin={"l": 50, "r": 50, "b": 50, "t": 50, "pad": 4},
-    )
-    return {"data": data_traces, "layout": graph_layout}
+# The tables and figures otherwise load on first use, in each worker.
+if os.environ.get("PRELOAD_DATA"):
+    preload()
 
 
 if __name__ == "__main__":
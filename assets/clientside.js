@@ -0,0 +1,223 @@
+/*
+Clientside figure builders, used when the app runs with CLIENTSIDE set
+(see application.py).  Each mirrors the generate_* function of the same
+graph in figures.py, reading from the data bundle built by bundle.py,
+which is fetched once and then revalidated by the browser with its ETag.
+*/
+(function () {
+    var bundlePromise = null;
+
+    // The bundle, fetched once.  The callbacks return promises of their
+    // figures, which Dash waits on, so the page stays responsive while
+    // the bundle downloads.
+    function getBundle() {
+        if (bundlePromise === null) {
+            var config = JSON.parse(
+                document.getElementById("_dash-config").textContent
+            );
+            bundlePromise = fetch(
+                config.requests_pathname_prefix + "data-bundle.json"
+            ).then(function (response) {
+                if (!response.ok) {
+                    throw new Error("data-bundle.json: HTTP " + response.status);
+                }
+                return response.json();
+            });
+            // Fetch it again on the next change of inputs after a failure.
+            bundlePromise.catch(function () {
+                bundlePromise = null;
+            });
+        }
+        return bundlePromise;
+    }
+
+    // A callback drawing a figure with build(bundle, ...inputs).
+    function withBundle(build) {
+        return function () {
+            var args = Array.prototype.slice.call(arguments);
+            return getBundle().then(function (b) {
+                return build.apply(null, [b].concat(args));
+            });
+        };
+    }
+
+    function key() {
+        return Array.prototype.slice.call(arguments).join("/");
+    }
+
+    function decade(year) {
+        return Math.floor(year / 10) * 10;
+    }
+
+    // Treatments in the order the server draws them (sorted).
+    function sorted(treatments) {
+        return (treatments || []).slice().sort();
+    }
+
+    function layout(b, graph, title) {
+        return Object.assign({}, b.layouts[graph], { title: { text: title } });
+    }
+
+    function regionTitle(b, prefix, region, scenario) {
+        return [
+            prefix,
+            b.labels.regions[region],
+            b.labels.scenarios[scenario],
+            b.labels.model_avg,
+        ].join(", ");
+    }
+
+    function rgba(color, opacity) {
+        return color.replace("rgb(", "rgba(").replace(")", ", " + opacity + ")");
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        jfsp: {
+            total_area_burned: withBundle(function (b, region, scenario, treatments) {
+                var h = b.historical[region];
+                var data = sorted(treatments).map(function (treatment, i) {
+                    var f = b.future[key(region, scenario, treatment)];
+                    var years = h.years.concat(f.years);
+                    var area = h.area.concat(f.area);
+                    if (i > 0) {
+                        var keep = years.map(function (year) {
+                            return year >= 2010 && year <= 2100;
+                        });
+                        years = years.filter(function (_, j) { return keep[j]; });
+                        area = area.filter(function (_, j) { return keep[j]; });
+                    }
+                    return {
+                        type: "box",
+                        name: "Area burned, " + b.labels.treatments[treatment],
+                        x: years.map(decade),
+                        y: area,
+                    };
+                });
+                return {
+                    data: data,
+                    layout: layout(b, "total_area_burned", regionTitle(
+                        b, "Total area burned", region, scenario
+                    )),
+                };
+            }),
+
+            replicate_spread: withBundle(function (b, region, scenario, treatments) {
+                var h = b.historical[region];
+                var runs = [["cru_tx0", "Historical", h.years, h.quantiles]];
+                sorted(treatments).forEach(function (treatment) {
+                    var f = b.future[key(region, scenario, treatment)];
+                    runs.push([
+                        treatment, b.labels.treatments[treatment], f.years, f.quantiles,
+                    ]);
+                });
+                var data = [];
+                // Without preprocessed quantiles, the layout carries a note.
+                if (h.quantiles === null) {
+                    runs = [];
+                }
+                runs.forEach(function (run, i) {
+                    var treatment = run[0], name = run[1], years = run[2], q = run[3];
+                    var color = b.labels.colors[i % b.labels.colors.length];
+                    [["p5", "p95", 0.2], ["p25", "p75", 0.4]].forEach(function (band) {
+                        data.push({
+                            type: "scatter",
+                            x: years,
+                            y: q[band[0]],
+                            mode: "lines",
+                            line: { width: 0, color: color },
+                            legendgroup: treatment,
+                            showlegend: false,
+                            hoverinfo: "skip",
+                        });
+                        data.push({
+                            type: "scatter",
+                            x: years,
+                            y: q[band[1]],
+                            mode: "lines",
+                            line: { width: 0, color: color },
+                            fill: "tonexty",
+                            fillcolor: rgba(color, band[2]),
+                            legendgroup: treatment,
+                            name: name + ", " + band[0] + "-" + band[1],
+                        });
+                    });
+                    data.push({
+                        type: "scatter",
+                        x: years,
+                        y: q.median,
+                        mode: "lines",
+                        line: { color: color },
+                        legendgroup: treatment,
+                        name: name + ", median",
+                    });
+                });
+                return {
+                    data: data,
+                    layout: layout(b, "replicate_spread", regionTitle(
+                        b, "Area burned across replicates", region, scenario
+                    )),
+                };
+            }),
+
+            ia: withBundle(function (b, region, scenario, treatments, window) {
+                var data = sorted(treatments).map(function (treatment) {
+                    var s = b.future[key(region, scenario, treatment)].ia[window];
+                    return {
+                        x: s.years,
+                        y: s.std,
+                        type: "line",
+                        name: window + "-year rolling standard deviation, "
+                            + b.labels.treatments[treatment],
+                    };
+                });
+                return {
+                    data: data,
+                    layout: layout(b, "ia", regionTitle(
+                        b, "Inter-annual variability", region, scenario
+                    )),
+                };
+            }),
+
+            veg_counts: withBundle(function (b, region, scenario, treatments) {
+                var data = sorted(treatments).map(function (treatment) {
+                    var f = b.future[key(region, scenario, treatment)];
+                    return {
+                        x: f.veg_years,
+                        y: f.veg_ratio,
+                        type: "line",
+                        name: [
+                            b.labels.treatments[treatment],
+                            b.labels.scenarios[scenario],
+                            b.labels.model_avg,
+                        ].join(", "),
+                    };
+                });
+                return {
+                    data: data,
+                    layout: layout(b, "veg_counts", regionTitle(
+                        b, "Ratio of Coniferous to Deciduous, by area", region, scenario
+                    )),
+                };
+            }),
+
+            costs: withBundle(function (b, scenario, treatments, option) {
+                var data = sorted(treatments).map(function (treatment) {
+                    var c = b.costs[key(scenario, treatment, option)];
+                    return {
+                        type: "box",
+                        name: b.labels.treatments[treatment],
+                        x: c.years.map(decade),
+                        y: c.cost,
+                    };
+                });
+                var title = option === "total"
+                    ? "Total Costs"
+                    : b.labels.fmo_options[option] + " Option";
+                return {
+                    data: data,
+                    layout: layout(b, "costs", "Future Costs, Full Model Domain, " + title),
+                };
+            }),
+        },
+    });
+})();
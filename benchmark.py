@@ -0,0 +1,570 @@
+# pylint: disable=C0103,E0401
+"""
+Benchmarks for the JFSP app callbacks and preprocessing.
+
+Run from the repository root (no server needed):
+
+    python benchmark.py
+
+prints the micro-benchmarks below, comparing implementations.  To track
+regressions across commits, run the benchmark suite instead:
+
+    python benchmark.py --json results.json
+
+which times every figure builder over a fixed sweep of inputs, the
+area, veg and cost preprocessing stages on a synthetic source tree (see
+preprocess/synthetic.py) and a cold import of the app, and writes the
+results, with the commit and library versions, as JSON ("-" for stdout).
+Both read the preprocessed tables from the current directory.
+
+"""
+import os
+import sys
+import gzip
+import json
+import shutil
+import argparse
+import platform
+import itertools
+import subprocess
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import plotly
+import luts
+import data
+import figures
+import payload
+from cache import FigureCache, to_json
+
+# Absolute, since some benchmarks run in a scratch directory.
+repo_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(repo_dir, "preprocess"))
+
+
+class MaskTable:
+    """
+    Reference implementation of data.Table.get using a boolean mask
+    per dimension over the whole table, i.e. the pre-index behaviour.
+    """
+
+    def __init__(self, frame, dims):
+        self.frame = frame
+        self.dims = dims
+
+    def get(self, **key):
+        """ Filter every row of the table on each dimension """
+        mask = pd.Series(True, index=self.frame.index)
+        for dim in self.dims:
+            if key[dim] == "":
+                mask &= self.frame[dim].isnull() | (self.frame[dim] == "")
+            else:
+                mask &= self.frame[dim] == key[dim]
+        return self.frame.loc[mask, [c for c in self.frame if c not in self.dims]]
+
+
+def region_inputs():
+    """ Inputs for the callbacks keyed on region """
+    treatments = list(luts.treatment_options)
+    return [
+        (region, scenario, treatments)
+        for region, scenario in itertools.product(luts.regions, luts.scenarios)
+    ]
+
+
+def cost_inputs():
+    """ Inputs for the costs callback """
+    treatments = list(luts.treatment_options)
+    return [
+        (scenario, treatments, option)
+        for scenario, option in itertools.product(
+            luts.scenarios, list(luts.fmo_options) + ["total"]
+        )
+    ]
+
+
+def time_calls(func, inputs, repeat=3):
+    """ Best-of-`repeat` mean latency of func over inputs, in ms """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for args in inputs:
+            func(*args)
+        best = min(best, (time.perf_counter() - start) / len(inputs))
+    return best * 1000
+
+
+def bench_callbacks():
+    """ Per-callback latency with mask filtering (before) and Table lookups """
+    callbacks = [
+        ("total_area_burned", figures.generate_total_area_burned, region_inputs),
+        ("ia", figures.generate_ia, region_inputs),
+        ("veg_counts", figures.generate_veg_counts, region_inputs),
+        ("costs", figures.generate_costs, cost_inputs),
+    ]
+    tables = {
+        "total_area_burned": (figures.total_area_burned, "total_area_burned"),
+        "total_area_burned_rolling_std": (
+            figures.total_area_burned_rolling_std,
+            "total_area_burned_rolling_std",
+        ),
+        "veg_counts": (figures.veg_counts, "veg_counts"),
+        "costs": (figures.costs, "costs"),
+    }
+    masked = {
+        name: MaskTable(data.read_frame(source), table.dims)
+        for name, (table, source) in tables.items()
+    }
+
+    print("{:<20} {:>12} {:>12}".format("callback (ms)", "mask", "indexed"))
+    for name, callback, inputs in callbacks:
+        for table_name, table in masked.items():
+            setattr(figures, table_name, table)
+        before = time_calls(callback, inputs())
+        for table_name, (table, _) in tables.items():
+            setattr(figures, table_name, table)
+        after = time_calls(callback, inputs())
+        print("{:<20} {:>12.2f} {:>12.2f}".format(name, before, after))
+
+
+def decades_loop(t):
+    """
+    The former per-decade bucketing: one get_group/assign/append per
+    decade (DataFrame.append is gone from current pandas, so concat).
+    """
+    dt = pd.DataFrame()
+    grouped = t.groupby(t.index // 10 * 10)
+    for key, _ in grouped:
+        dt = pd.concat([dt, grouped.get_group(key).assign(decade=key)])
+    return dt
+
+
+def decades_vectorized(t):
+    """ Bucketing as done in figures.py """
+    return t.assign(decade=t.index // 10 * 10)
+
+
+def bench_decades():
+    """ Decadal bucketing of the area series for all regions and scenarios """
+    table = figures.total_area_burned
+    series = []
+    for region, scenario in itertools.product(luts.regions, luts.scenarios):
+        h = table.get(
+            region=region,
+            scenario="",
+            model="",
+            treatment=luts.historical_categories[1],
+        )
+        for treatment in luts.treatment_options:
+            t = table.get(
+                region=region,
+                scenario=scenario,
+                model=luts.MODEL_AVG,
+                treatment=treatment,
+            )
+            series.append((pd.concat([h, t]),))
+
+    print("{:<20} {:>12} {:>12}".format("decades (ms)", "loop", "vectorized"))
+    print(
+        "{:<20} {:>12.3f} {:>12.3f}".format(
+            "area, per series",
+            time_calls(decades_loop, series),
+            time_calls(decades_vectorized, series),
+        )
+    )
+
+
+def bench_cache():
+    """ Latency of a cached figure vs. building it """
+    figure_cache = FigureCache()
+    generate_ia = figure_cache.memoize(figures.generate_ia)
+    inputs = region_inputs()
+    miss = time_calls(generate_ia, inputs, repeat=1)
+    hit = time_calls(generate_ia, inputs)
+    print("ia cache (ms): miss {:.2f}, hit {:.3f}".format(miss, hit))
+    print(figure_cache.stats())
+
+
+# Run in a fresh interpreter: load every table and touch all of its
+# values (as serving the whole input space would), then report the load
+# time and memory: RSS, and the part of it private to the process.
+format_probe = """
+import os, sys, time, resource
+start = time.perf_counter()
+import numpy as np, pandas as pd, data
+tables = []
+for name, dims in data.sources.items():
+    if not os.path.isfile(name + ".pickle"):
+        continue
+    if sys.argv[1] == "pickle":
+        tables.append(data.Table.from_frame(pd.read_pickle(name + ".pickle"), dims))
+    else:
+        tables.append(data.read_columns(sys.argv[2] + "/" + name + ".columns"))
+elapsed = time.perf_counter() - start
+for table in tables:
+    for values in table.values.values():
+        np.asarray(values).sum()
+private = 0
+with open("/proc/self/smaps_rollup") as smaps:
+    for line in smaps:
+        if line.startswith("Private"):
+            private += int(line.split()[1])
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(elapsed * 1000, rss / 1024, private / 1024)
+"""
+
+
+def bench_formats():
+    """ Cold start and memory of the pickle vs. the columnar tables """
+    columns_dir = tempfile.mkdtemp()
+    for name, dims in data.sources.items():
+        if not os.path.isfile(name + ".pickle"):
+            continue
+        data.write_columns(
+            pd.read_pickle(name + ".pickle"),
+            os.path.join(columns_dir, name + ".columns"),
+            dims,
+        )
+
+    print(
+        "{:<12} {:>12} {:>12} {:>12}".format(
+            "format", "load (ms)", "RSS (MB)", "private (MB)"
+        )
+    )
+    for table_format in ["pickle", "columnar"]:
+        output = subprocess.check_output(
+            [sys.executable, "-c", format_probe, table_format, columns_dir]
+        )
+        print(
+            "{:<12} {:>12.1f} {:>12.1f} {:>12.1f}".format(
+                table_format, *map(float, output.split())
+            )
+        )
+
+
+def bench_categoricals():
+    """ Memory and mask-filter time with object vs. categorical dimensions """
+    frame = pd.read_pickle("total_area_burned.pickle")
+    frames = {
+        "object": frame.astype({dim: object for dim in data.area_dims}),
+        "categorical": data.categorize(frame.copy()),
+    }
+    key = {
+        "region": "AllFMZs",
+        "scenario": "rcp60",
+        "model": luts.MODEL_AVG,
+        "treatment": "gcm_tx0",
+    }
+    print("{:<12} {:>12} {:>12}".format("dims", "memory (MB)", "filter (ms)"))
+    for name, table in frames.items():
+        if name == "categorical":
+            # Filter on integer codes, as data.Table does.
+            columns = {dim: table[dim].cat.codes.to_numpy() for dim in data.area_dims}
+            values = {
+                dim: luts.categories[dim].index(key[dim]) for dim in data.area_dims
+            }
+        else:
+            columns = {dim: table[dim].to_numpy() for dim in data.area_dims}
+            values = key
+
+        def mask_filter():
+            mask = True
+            for dim in data.area_dims:
+                mask = mask & (columns[dim] == values[dim])
+            return table[mask]
+
+        memory = table.memory_usage(deep=True).sum() / 2**20
+        print(
+            "{:<12} {:>12.1f} {:>12.3f}".format(
+                name, memory, time_calls(mask_filter, [()] * 20)
+            )
+        )
+
+
+def bench_veg(replicates=8):
+    """ veg.process against a synthetic data directory """
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp())  # importing cost writes random_year_map.csv
+    try:
+        # pylint: disable=import-outside-toplevel
+        import synthetic
+        import ingest
+        import veg
+
+        synthetic.generate("data", replicates=replicates, stages=[veg])
+        ingest.prefetched.clear()
+        start = time.perf_counter()
+        ingest.prefetch(veg.source_files("data"))
+        read = time.perf_counter() - start
+        veg.process("data")
+        total = time.perf_counter() - start
+    finally:
+        os.chdir(cwd)
+    print("veg.process (s): read {:.1f}, aggregate {:.1f}".format(read, total - read))
+
+
+def bench_payloads():
+    """
+    Bytes on the wire per graph for the default view (and the cost
+    options), full figures vs slimmed with lists and with typed arrays.
+    """
+    views = [
+        (name, builder, ("AllFMZs", "rcp60", ["gcm_tx0"]))
+        for name, builder in figures.builders.items()
+        if builder is not figures.generate_costs
+    ]
+    views.append(("costs", figures.generate_costs, ("rcp60", ["gcm_tx0"], "total")))
+
+    def sizes(figure):
+        body = to_json(figure).encode()
+        return len(body), len(gzip.compress(body))
+
+    print(
+        "{:<20} {:>16} {:>16} {:>16}".format(
+            "payload (B, gzip)", "full", "slim", "slim typed"
+        )
+    )
+    for name, builder, args in views:
+        figure = builder(*args)
+        columns = [
+            sizes(figure),
+            sizes(payload.slim(figure, typed_arrays=False)),
+            sizes(payload.slim(figure, typed_arrays=True)),
+        ]
+        print(
+            "{:<20} {:>16} {:>16} {:>16}".format(
+                name, *("{}, {}".format(*column) for column in columns)
+            )
+        )
+
+
+def bench_load():
+    """ Startup cost of building the indexed tables """
+    start = time.perf_counter()
+    for name, dims in data.sources.items():
+        if os.path.isfile(name + ".pickle"):
+            data.Table.from_frame(pd.read_pickle(name + ".pickle"), dims)
+    print("Table load: {:.1f} ms".format((time.perf_counter() - start) * 1000))
+
+
+def summary(seconds):
+    """ Statistics of a list of timings, in ms """
+    ms = np.array(seconds) * 1000
+    return {
+        "n": len(ms),
+        "min_ms": round(float(ms.min()), 4),
+        "median_ms": round(float(np.median(ms)), 4),
+        "mean_ms": round(float(ms.mean()), 4),
+        "p95_ms": round(float(np.percentile(ms, 95)), 4),
+        "max_ms": round(float(ms.max()), 4),
+    }
+
+
+def sweep(name):
+    """
+    Inputs for a figure builder: every region (or FMO option, for costs)
+    and scenario, with one treatment and with all of them.
+    """
+    treatments = sorted(luts.treatment_options)
+    subsets = [treatments[:1], treatments]
+    if name == "costs":
+        options = list(luts.fmo_options) + ["total"]
+        return list(itertools.product(luts.scenarios, subsets, options))
+    return list(itertools.product(luts.regions, luts.scenarios, subsets))
+
+
+def suite_callbacks(repeat):
+    """
+    Per-call latency of each figure builder (uncached) over its sweep:
+    the best of repeat calls for each input.
+    """
+    results = {}
+    for name, builder in figures.builders.items():
+        inputs = sweep(name)
+        for args in inputs:
+            builder(*args)  # load the tables, warm up
+        best = []
+        for args in inputs:
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                builder(*args)
+                times.append(time.perf_counter() - start)
+            best.append(min(times))
+        results[builder.__name__] = summary(best)
+    return results
+
+
+def suite_stages(replicates, repeat, workers, scaling):
+    """
+    Wall time of the area, veg and cost stages on a synthetic source
+    tree, reading every file (no preprocessing cache).  scaling holds
+    keyword arguments for synthetic.scale, e.g. more regions.
+    """
+    cwd = os.getcwd()
+    work_dir = tempfile.mkdtemp()
+    os.chdir(work_dir)  # the stages write their outputs here
+    try:
+        # pylint: disable=import-outside-toplevel
+        import synthetic
+
+        # Generated first: it scales the lookup tables the stages read.
+        synthetic.generate("data", replicates=replicates, **scaling)
+        import ingest
+        import area
+        import veg
+        import cost
+
+        ingest.workers = workers
+        ingest.cache_dir = None
+        results = {}
+        for stage in [area, veg, cost]:
+            times = []
+            for _ in range(repeat):
+                ingest.prefetched.clear()
+                start = time.perf_counter()
+                stage.process("data")
+                times.append(time.perf_counter() - start)
+            results[stage.__name__ + ".process"] = summary(times)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir)
+    return results
+
+
+def suite_import(repeat):
+    """
+    Cold import of the app in a fresh interpreter: as deployed (tables
+    loaded on first use), and with PRELOAD_DATA.
+    """
+    probe = (
+        "import time; start = time.perf_counter(); import application; "
+        "print(time.perf_counter() - start)"
+    )
+    results = {}
+    for name, preload in [("application", ""), ("application_preload", "1")]:
+        env = dict(
+            os.environ,
+            PYTHONPATH=repo_dir,
+            REQUESTS_PATHNAME_PREFIX="/",
+            PRELOAD_DATA=preload,
+        )
+        times = []
+        for _ in range(repeat):
+            output = subprocess.check_output(
+                [sys.executable, "-W", "ignore", "-c", probe],
+                env=env,
+                stderr=subprocess.DEVNULL,
+            )
+            times.append(float(output.split()[-1]))
+        results[name] = summary(times)
+    return results
+
+
+def environment(args):
+    """ What the results were measured on """
+
+    def git(*command):
+        try:
+            return subprocess.check_output(
+                ["git"] + list(command),
+                cwd=repo_dir,
+                stderr=subprocess.DEVNULL,
+                universal_newlines=True,
+            ).strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    return {
+        "commit": git("rev-parse", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "plotly": plotly.__version__,
+        "config": {
+            "repeat": args.repeat,
+            "replicates": args.replicates,
+            "workers": args.workers,
+            "seed": luts.random_seed,
+            "scaling": scaling(args),
+        },
+    }
+
+
+def scaling(args):
+    """ Scale of the synthetic tree for the stages, from the arguments """
+    return {
+        name: getattr(args, name)
+        for name in ["regions", "models", "first_year", "last_year"]
+        if getattr(args, name) is not None
+    }
+
+
+def run_suite(args):
+    """ The benchmark suite, as a dict ready to write as JSON """
+    # pylint: disable=import-outside-toplevel
+    import synthetic
+
+    results = {"environment": environment(args)}
+    # The tables may have been preprocessed from a scaled synthetic tree.
+    results["environment"]["data"] = synthetic.apply("data")
+    results["callbacks"] = suite_callbacks(args.repeat)
+    results["stages"] = suite_stages(
+        args.replicates, args.repeat, args.workers, scaling(args)
+    )
+    results["import"] = suite_import(args.repeat)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--json", metavar="PATH", help="run the benchmark suite, writing JSON to PATH"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="runs of each case (default: 5)"
+    )
+    parser.add_argument(
+        "--replicates",
+        type=int,
+        default=8,
+        help="replicates per synthetic source file (default: 8)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="processes reading source files in the stages (default: 1)",
+    )
+    for name in ["regions", "models", "first-year", "last-year"]:
+        parser.add_argument(
+            "--" + name,
+            type=int,
+            help="scale the synthetic tree for the stages, see preprocess/synthetic.py",
+        )
+    args = parser.parse_args()
+
+    if args.json:
+        suite_results = run_suite(args)
+        if args.json == "-":
+            json.dump(suite_results, sys.stdout, indent=2)
+            print()
+        else:
+            with open(args.json, "w") as results_file:
+                json.dump(suite_results, results_file, indent=2)
+    else:
+        bench_load()
+        bench_formats()
+        bench_categoricals()
+        bench_callbacks()
+        bench_decades()
+        bench_cache()
+        bench_veg()
+        bench_payloads()
@@ -0,0 +1,176 @@
+# pylint: disable=C0103,E0401
+"""
+Compact data bundle for drawing the figures in the browser.
+
+In clientside mode (see application.py) the figures are built by Dash
+clientside callbacks (assets/clientside.js) instead of on the server.
+They read everything they need from this bundle, which is fetched once
+per browser and revalidated with an ETag: the series behind each figure,
+already aggregated the way figures.py aggregates them (5-model average,
+acres, rolling windows), the GUI labels and the layout of each graph.
+
+"""
+import gzip
+import json
+import hashlib
+import plotly
+from plotly.colors import DEFAULT_PLOTLY_COLORS
+from flask import Response, request
+import luts
+import figures
+
+
+def key(*dims):
+    """Bundle key for a series, e.g. "AllFMZs/rcp60/gcm_tx0" """
+    return "/".join(dims)
+
+
+def acres(series):
+    """ Series in square km as a list of acres """
+    return luts.to_acres_array(series.to_numpy()).tolist()
+
+
+def layouts():
+    """ Layout of each graph, without its title (set in the browser) """
+    args = {
+        "costs": ("rcp60", [], "total"),
+    }
+    result = {}
+    for graph, builder in figures.builders.items():
+        layout = builder(*args.get(graph, ("AllFMZs", "rcp60", [])))["layout"]
+        layout = (
+            layout.to_plotly_json() if hasattr(layout, "to_plotly_json") else layout
+        )
+        result[graph] = {
+            name: value for name, value in layout.items() if name != "title"
+        }
+    return result
+
+
+def quantiles(**dims):
+    """
+    Replicate quantiles of area burned for a series, or None if they
+    haven't been preprocessed (see figures.generate_replicate_spread).
+    """
+    if not figures.total_area_burned_quantiles.available():
+        return None
+    q = figures.total_area_burned_quantiles.get(**dims)
+    return {name: acres(q[name]) for name in ["p5", "p25", "median", "p75", "p95"]}
+
+
+def historical(region):
+    """ Historical series for a region """
+    dims = {
+        "region": region,
+        "scenario": "",
+        "model": "",
+        "treatment": luts.historical_categories[1],
+    }
+    area = figures.total_area_burned.get(**dims)
+    return {
+        "years": area.index.tolist(),
+        "area": acres(area.area),
+        "quantiles": quantiles(**dims),
+    }
+
+
+def future(region, scenario, treatment):
+    """ 5-model average series for a region, scenario and treatment """
+    dims = {
+        "region": region,
+        "scenario": scenario,
+        "model": luts.MODEL_AVG,
+        "treatment": treatment,
+    }
+    area = figures.total_area_burned.get(**dims)
+    rolling_std = figures.total_area_burned_rolling_std.get(**dims)
+    vc = figures.veg_counts.get(**dims)
+
+    ia = {}
+    for window in luts.rolling_windows:
+        std = rolling_std["std_" + str(window)].dropna()
+        ia[window] = {"years": std.index.tolist(), "std": acres(std)}
+
+    return {
+        "years": area.index.tolist(),
+        "area": acres(area.area),
+        "quantiles": quantiles(**dims),
+        "ia": ia,
+        "veg_years": vc.index.tolist(),
+        "veg_ratio": (vc["coniferous"] / vc["deciduous"]).tolist(),
+    }
+
+
+def future_costs(scenario, treatment, option):
+    """ 5-model average costs for a scenario, treatment and FMO option """
+    c = figures.costs.get(
+        scenario=scenario, model=luts.MODEL_AVG, treatment=treatment, option=option
+    )
+    return {"years": c.index.tolist(), "cost": c.cost.tolist()}
+
+
+def build():
+    """ The bundle, as a dict ready to serialize """
+    fmo_options = dict(luts.fmo_options)
+    fmo_options["total"] = "Total Costs"
+    return {
+        "labels": {
+            "regions": luts.regions,
+            "scenarios": luts.scenarios,
+            "treatments": luts.treatment_options,
+            "fmo_options": fmo_options,
+            "model_avg": luts.MODEL_AVG_LABEL,
+            "colors": DEFAULT_PLOTLY_COLORS,
+        },
+        "layouts": layouts(),
+        "historical": {region: historical(region) for region in luts.regions},
+        "future": {
+            key(region, scenario, treatment): future(region, scenario, treatment)
+            for region in luts.regions
+            for scenario in luts.scenarios
+            for treatment in luts.treatment_options
+        },
+        "costs": {
+            key(scenario, treatment, option): future_costs(scenario, treatment, option)
+            for scenario in luts.scenarios
+            for treatment in luts.treatment_options
+            for option in fmo_options
+        },
+    }
+
+
+class Bundle:
+    """
+    The serialized, gzipped bundle and its ETag, built on first use
+    (building it touches every series of every table).
+    """
+
+    def __init__(self):
+        self.body = None
+        self.etag = None
+
+    def load(self):
+        """ Build the bundle if needed; returns (gzipped body, etag) """
+        if self.body is None:
+            body = json.dumps(
+                build(), cls=plotly.utils.PlotlyJSONEncoder, separators=(",", ":")
+            ).encode()
+            self.etag = hashlib.sha256(body).hexdigest()[:32]
+            self.body = gzip.compress(body, 9)
+        return self.body, self.etag
+
+    def response(self):
+        """
+        Flask response with the bundle, which browsers revalidate with
+        its ETag (so unchanged bundles cost a 304 with no body).
+        """
+        body, etag = self.load()
+        if request.accept_encodings["gzip"] > 0:
+            response = Response(body, mimetype="application/json")
+            response.headers["Content-Encoding"] = "gzip"
+        else:
+            response = Response(gzip.decompress(body), mimetype="application/json")
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers["Vary"] = "Accept-Encoding"
+        response.set_etag(etag)
+        return response.make_conditional(request)
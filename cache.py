@@ -0,0 +1,375 @@
+# pylint: disable=C0103,E0401
+"""
+In-process memoization of figures for the Dash callbacks.
+
+Every callback is a pure function of a small, finite input space (see
+luts.py), so identical figures can be reused across requests.  Inputs
+are normalized before use as a cache key; in particular the treatment
+checklist is sorted, so ["gcm_tx1", "gcm_tx0"] and ["gcm_tx0", "gcm_tx1"]
+share an entry (and draw their traces in the same order).
+
+Figures can also be precomputed for the whole input space ahead of time
+(see preprocess/precompute.py) and served from a read-only store.
+
+Server workers each have their own in-process caches.  A SharedCache is
+a store they can all read and write: an SQLite database in WAL mode on
+local disk, so it needs no other service, with entries expiring after a
+time to live and evicted least recently used beyond a total size.
+
+"""
+import os
+import gzip
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from functools import wraps
+import plotly
+
+
+def normalize_args(args):
+    """ Lists (checklist values) are sorted so their order doesn't matter """
+    return tuple(tuple(sorted(arg)) if isinstance(arg, list) else arg for arg in args)
+
+
+def figure_key(name, args):
+    """ String key for a figure, used by the precomputed store """
+    return json.dumps(
+        [name]
+        + [list(arg) if isinstance(arg, tuple) else arg for arg in normalize_args(args)]
+    )
+
+
+def to_json(figure):
+    """ Serialize a figure (which may hold plotly objects) to JSON """
+    return json.dumps(figure, cls=plotly.utils.PlotlyJSONEncoder)
+
+
+def figure_size(figure):
+    """ Size of the figure once serialized to JSON, in bytes """
+    return len(to_json(figure))
+
+
+class FigureCache:
+    """
+    Bounded LRU cache of figures, keyed on callback name and normalized
+    inputs.  Optionally capped by the total serialized size of the
+    cached figures as well as by the number of entries.
+    """
+
+    def __init__(self, max_entries=2048, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """ Return the cached figure for key, or None """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, figure, size=None):
+        """
+        Store a figure, evicting least recently used entries as needed.
+        Entries that are not figures (e.g. serialized responses) should
+        give their size in bytes.
+        """
+        if size is None:
+            size = figure_size(figure) if self.max_bytes is not None else 0
+        with self._lock:
+            if key in self._entries:
+                self.size -= self._entries.pop(key)[1]
+            self._entries[key] = (figure, size)
+            self.size += size
+            while self._entries and (
+                len(self._entries) > self.max_entries
+                or (self.max_bytes is not None and self.size > self.max_bytes)
+            ):
+                self.size -= self._entries.popitem(last=False)[1][1]
+
+    def clear(self):
+        """ Drop all entries and reset the counters """
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.size = 0
+
+    def stats(self):
+        """ Counters for monitoring """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def memoize(self, func):
+        """
+        Decorator for a figure-producing callback.  The callback is
+        called with the normalized arguments, e.g. a sorted treatment list.
+        """
+
+        @wraps(func)
+        def wrapper(*args):
+            args = normalize_args(args)
+            key = (func.__name__,) + args
+            figure = self.get(key)
+            if figure is None:
+                figure = func(
+                    *(list(arg) if isinstance(arg, tuple) else arg for arg in args)
+                )
+                self.put(key, figure)
+            return figure
+
+        return wrapper
+
+
+class SharedCache:
+    """
+    Cache shared by the processes on a host, in an SQLite database at
+    path.  Values are dicts of bytes, e.g. a response body in each of
+    its encodings, with a key from fields; each is stored as a plain BLOB
+    column, so nothing read from the database is ever unpickled.  Keys
+    are prefixed with namespace: the database outlives the processes, so
+    whatever changes the values (settings, data, code) belongs in it.
+    Entries older than ttl seconds are ignored and then deleted; beyond
+    max_bytes in total, the least recently used are evicted.  Lookups
+    never raise: a database error or a malformed entry counts as a miss,
+    or a dropped write, and is counted in the stats.
+    """
+
+    # Seconds between updates of an entry's last use, so hits mostly
+    # only read the database.
+    touch_interval = 10
+
+    # Names of the values stored for each entry (see responses.py).
+    fields = ("identity", "gzip", "br")
+
+    def __init__(self, path, ttl=None, max_bytes=None, namespace=""):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _count(self, counter):
+        """ Increment one of the counters """
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _connection(self):
+        """
+        This thread's connection, opened on first use.  Reopened in a
+        forked process, since connections can't be shared across a fork.
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            # The values last, so scans of the other columns (expiry and
+            # eviction) don't read through their overflow pages.
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY,"
+                " size INTEGER, created REAL, used REAL, "
+                + ", ".join(field + " BLOB" for field in self.fields)
+                + ")"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS responses_created ON responses (created)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS responses_used ON responses (used, size)"
+            )
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, key):
+        """ Return the cached value (a dict of bytes) for key, or None """
+        now = time.time()
+        key = self.namespace + key
+        value = None
+        try:
+            connection = self._connection()
+            row = connection.execute(
+                "SELECT created, used, "
+                + ", ".join(self.fields)
+                + " FROM responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is not None and self.ttl is not None and now - row[0] > self.ttl:
+                connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is not None:
+                value = {
+                    field: blob
+                    for field, blob in zip(self.fields, row[2:])
+                    if blob is not None
+                }
+                if not value or not all(
+                    isinstance(blob, bytes) for blob in value.values()
+                ):
+                    raise ValueError("Malformed shared cache entry")
+                if now - row[1] > self.touch_interval:
+                    connection.execute(
+                        "UPDATE responses SET used = ? WHERE key = ?", (now, key)
+                    )
+        except (sqlite3.Error, ValueError):
+            self._count("errors")
+            value = None
+        if value is None:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return value
+
+    def put(self, key, value):
+        """ Store a value, then drop expired and excess entries """
+        now = time.time()
+        key = self.namespace + key
+        blobs = [value.get(field) for field in self.fields]
+        size = sum(len(blob) for blob in blobs if blob is not None)
+        try:
+            connection = self._connection()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, "
+                    + ", ".join("?" for _ in self.fields)
+                    + ")",
+                    [key, size, now, now] + blobs,
+                )
+                if self.ttl is not None:
+                    connection.execute(
+                        "DELETE FROM responses WHERE created < ?", (now - self.ttl,)
+                    )
+                if self.max_bytes is not None:
+                    self._evict(connection)
+                connection.execute("COMMIT")
+            except sqlite3.Error:
+                connection.execute("ROLLBACK")
+                raise
+        except sqlite3.Error:
+            self._count("errors")
+
+    def _evict(self, connection):
+        """ Delete least recently used entries down to max_bytes """
+        (total,) = connection.execute("SELECT TOTAL(size) FROM responses").fetchone()
+        excess = total - self.max_bytes
+        if excess <= 0:
+            return
+        evicted = []
+        for key, size in connection.execute(
+            "SELECT key, size FROM responses ORDER BY used"
+        ):
+            if excess <= 0:
+                break
+            evicted.append((key,))
+            excess -= size
+        connection.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def clear(self):
+        """ Drop all entries (for every process) and reset the counters """
+        try:
+            self._connection().execute("DELETE FROM responses")
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self.hits = self.misses = self.errors = 0
+
+    def stats(self):
+        """ Counters for monitoring; hits and misses are this process's """
+        try:
+            entries, size = (
+                self._connection()
+                .execute("SELECT COUNT(*), TOTAL(size) FROM responses")
+                .fetchone()
+            )
+        except sqlite3.Error:
+            entries, size = 0, 0
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "bytes": int(size),
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class PrecomputedFigures:
+    """
+    Read-only store of serialized figures.  The file is gzipped text with
+    one figure per line: the figure key (see figure_key), a tab, and the
+    figure JSON.  Figures are kept serialized and only parsed on lookup.
+    The file is read on first use (or by load).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.figures = None
+        self.load_seconds = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        """ Read the file, unless it already has been """
+        if self.figures is None:
+            with self.lock:
+                if self.figures is None:
+                    start = time.perf_counter()
+                    figures = {}
+                    if os.path.isfile(self.path):
+                        figures = read_precomputed(self.path)
+                    self.load_seconds = time.perf_counter() - start
+                    self.figures = figures
+        return self.figures
+
+    def __len__(self):
+        return len(self.load())
+
+    def get(self, name, args):
+        """ Return the figure for name(*args), or None if not precomputed """
+        figure = self.load().get(figure_key(name, args))
+        if figure is None:
+            return None
+        return json.loads(figure)
+
+
+def read_precomputed(path):
+    """ The serialized figures written by write_precomputed, by figure key """
+    figures = {}
+    with gzip.open(path, "rt") as figures_file:
+        for line in figures_file:
+            key, figure = line.rstrip("\n").split("\t", 1)
+            figures[key] = figure
+    return figures
+
+
+def write_precomputed(path, figures, kept=None):
+    """
+    Write an iterable of (name, args, figure) for PrecomputedFigures,
+    after kept, serialized figures by key (see read_precomputed), if given.
+    """
+    with gzip.open(path, "wt") as figures_file:
+        for key, figure in (kept or {}).items():
+            figures_file.write(key + "\t" + figure + "\n")
+        for name, args, figure in figures:
+            figures_file.write(figure_key(name, args) + "\t" + to_json(figure) + "\n")
@@ -0,0 +1,322 @@
+# pylint: disable=C0103,E0401
+"""
+Data access layer for the JFSP app.
+
+The preprocessed tables (see preprocess.py) are tidy: one row per year,
+with dimension columns (region, scenario, model, treatment...) repeated
+on every row.  Rather than filtering the whole table with boolean masks
+on each callback, a Table is sorted by its dimension columns once so that
+every series occupies a contiguous block of rows.  A lookup is then a
+dict access followed by a slice.
+
+Tables are stored either as pickled DataFrames, or in a columnar format:
+a directory holding one .npy file per column (integer codes for the
+dimension columns) and a meta.json with the code -> value categories.
+The columnar arrays are already sorted and are memory-mapped when read,
+so forked server workers share their pages.
+
+The app reads the tables through `tables`, which loads each one on first
+use; preload() loads them all up front, e.g. in a server's master process
+before it forks its workers.  Tables that can only be built from the raw
+source data (e.g. the replicate quantiles) may be missing: check with
+LazyTable.available() before using one.
+
+"""
+import os
+import json
+import time
+import threading
+import numpy as np
+import pandas as pd
+import luts
+import metrics
+
+# Dimension columns used to key each of the preprocessed tables.
+area_dims = ["region", "scenario", "model", "treatment"]
+veg_dims = ["region", "scenario", "model", "treatment"]
+cost_dims = ["scenario", "model", "treatment", "option"]
+
+# Preprocessed tables, by file name stem.
+sources = {
+    "total_area_burned": area_dims,
+    "total_area_burned_quantiles": area_dims,
+    "total_area_burned_rolling_std": area_dims,
+    "veg_counts": veg_dims,
+    "costs": cost_dims,
+}
+
+
+def normalize_key(values):
+    """
+    Missing dimension values (NaN / None) are stored as the empty string,
+    so historical rows can be looked up with e.g. scenario="".
+    """
+    return tuple("" if pd.isnull(value) else value for value in values)
+
+
+def categorize(frame):
+    """
+    Convert the dimension columns of a tidy table, in place, to
+    Categoricals with the fixed category orders from luts.categories.
+    """
+    for dim, categories in luts.categories.items():
+        if dim in frame:
+            column = pd.Categorical(frame[dim], categories=categories)
+            if (pd.isnull(column) != frame[dim].isnull()).any():
+                unknown = set(frame[dim].dropna()) - set(categories)
+                raise ValueError("Unknown {} values: {}".format(dim, unknown))
+            frame[dim] = column
+    return frame
+
+
+def encode(frame, dims):
+    """
+    Integer codes and categories for each dimension column: the
+    categorical codes if the column is a Categorical, otherwise codes
+    from sorted unique values.  Missing values get code -1.  Also returns
+    the row order that sorts the frame by the codes; the sort is stable,
+    so years stay in order.
+    """
+    codes = {}
+    categories = {}
+    for dim in dims:
+        if isinstance(frame[dim].dtype, pd.CategoricalDtype):
+            codes[dim] = frame[dim].cat.codes.to_numpy()
+            categories[dim] = list(frame[dim].cat.categories)
+        else:
+            codes[dim], uniques = pd.factorize(frame[dim], sort=True)
+            categories[dim] = list(uniques)
+    order = np.lexsort([codes[dim] for dim in reversed(dims)])
+    return {dim: codes[dim][order] for dim in dims}, categories, order
+
+
+class Table:
+    """
+    A tidy, year-indexed table with an index from each
+    dimension key to the block of rows it occupies.
+
+    Build one from a DataFrame with Table.from_frame, or from
+    columnar arrays (already sorted by their dimension codes).
+    """
+
+    def __init__(self, dims, years, codes, categories, values):
+        self.dims = dims
+        self.years = years
+        self.values = values
+        self.value_columns = list(values)
+
+        # Lookups translate dimension values to their codes.
+        self.codes = {
+            dim: {label: code for code, label in enumerate(categories[dim])}
+            for dim in dims
+        }
+
+        # Missing values (code -1) are looked up as "", so they share
+        # a code with the "" category where there is one.
+        stacked = np.column_stack([codes[dim] for dim in dims])
+        for column, dim in enumerate(dims):
+            missing = self.codes[dim].setdefault("", -1)
+            stacked[stacked[:, column] == -1, column] = missing
+
+        # Rows for a key are contiguous, so a block starts
+        # wherever any of the dimension codes changes value.
+        changed = (stacked[1:] != stacked[:-1]).any(axis=1)
+        starts = np.concatenate([[0], np.flatnonzero(changed) + 1])
+        stops = np.concatenate([starts[1:], [len(stacked)]])
+        self.blocks = {
+            tuple(stacked[start].tolist()): slice(start, stop)
+            for start, stop in zip(starts, stops)
+        }
+
+    @classmethod
+    def from_frame(cls, frame, dims):
+        """ Index a year-indexed tidy DataFrame """
+        codes, categories, order = encode(frame, dims)
+        values = {
+            column: frame[column].to_numpy()[order]
+            for column in frame.columns
+            if column not in dims
+        }
+        return cls(dims, frame.index.to_numpy()[order], codes, categories, values)
+
+    def get(self, **key):
+        """
+        Return the year-indexed rows matching the given dimension values,
+        e.g. table.get(region="AllFMZs", scenario="rcp60", ...).  Unknown
+        keys return an empty frame, mirroring an empty boolean-mask filter.
+        """
+        start = time.perf_counter()
+        codes = tuple(
+            self.codes[dim].get(value)
+            for dim, value in zip(
+                self.dims, normalize_key(key[dim] for dim in self.dims)
+            )
+        )
+        block = self.blocks.get(codes, slice(0, 0))
+        index = pd.Index(self.years[block].astype(np.int64), name="year")
+        frame = pd.DataFrame(
+            {column: self.values[column][block] for column in self.value_columns},
+            index=index,
+        )
+        metrics.filtered(time.perf_counter() - start, block.stop - block.start)
+        return frame
+
+
+def write_columns(frame, path, dims):
+    """
+    Write a year-indexed tidy DataFrame to the columnar format at path
+    (a directory), sorted by its dimension codes.
+    """
+    codes, categories, order = encode(frame, dims)
+    os.makedirs(path, exist_ok=True)
+    np.save(
+        os.path.join(path, "year.npy"), frame.index.to_numpy()[order].astype(np.int16)
+    )
+    for dim in dims:
+        # The smallest signed type for the codes, which may be -1 (missing).
+        dtype = np.result_type(np.int8, np.min_scalar_type(-len(categories[dim])))
+        np.save(os.path.join(path, dim + ".npy"), codes[dim].astype(dtype))
+
+    values = [column for column in frame.columns if column not in dims]
+    for column in values:
+        # Object columns (e.g. costs from older pickles) are numeric really.
+        array = pd.to_numeric(frame[column]).to_numpy()[order]
+        np.save(os.path.join(path, column + ".npy"), array)
+
+    with open(os.path.join(path, "meta.json"), "w") as meta_file:
+        json.dump({"dims": dims, "categories": categories, "values": values}, meta_file)
+
+
+def read_columns(path, mmap_mode="r"):
+    """ Read a Table from the columnar format, memory-mapping its arrays """
+
+    def load(column):
+        return np.load(os.path.join(path, column + ".npy"), mmap_mode=mmap_mode)
+
+    with open(os.path.join(path, "meta.json")) as meta_file:
+        meta = json.load(meta_file)
+    dims = meta["dims"]
+    return Table(
+        dims,
+        load("year"),
+        {dim: load(dim) for dim in dims},
+        meta["categories"],
+        {column: load(column) for column in meta["values"]},
+    )
+
+
+def rolling_std(total_area_burned):
+    """
+    The total_area_burned_rolling_std table (see preprocess/rolling.py)
+    computed from the total_area_burned DataFrame: a centered rolling
+    std of area burned per series, for each of luts.rolling_windows.
+    """
+    parts = []
+    for _, t in total_area_burned.groupby(
+        area_dims, sort=False, dropna=False, observed=True
+    ):
+        parts.append(
+            t[area_dims].assign(
+                **{
+                    "std_" + str(window): t.area.rolling(window, center=True).std()
+                    for window in luts.rolling_windows
+                }
+            )
+        )
+    return categorize(pd.concat(parts))
+
+
+# Tables that can be computed from another table's pickle when they
+# haven't been written themselves: (source table, function of its frame).
+derived = {"total_area_burned_rolling_std": ("total_area_burned", rolling_std)}
+
+
+def exists(name):
+    """ Whether the preprocessed table called name is written, or derivable """
+    return (
+        os.path.isdir(name + ".columns")
+        or os.path.isfile(name + ".pickle")
+        or (name in derived and os.path.isfile(derived[name][0] + ".pickle"))
+    )
+
+
+def read_frame(name):
+    """
+    The preprocessed table called name as a DataFrame, from its pickle,
+    or computed from its source table (see derived) if there is none.
+    """
+    if os.path.isfile(name + ".pickle"):
+        return pd.read_pickle(name + ".pickle")
+    if name in derived and os.path.isfile(derived[name][0] + ".pickle"):
+        source, derive = derived[name]
+        return derive(pd.read_pickle(source + ".pickle"))
+    raise FileNotFoundError(
+        "No preprocessed {} table ({}.columns or {}.pickle), "
+        "see preprocess.py".format(name, name, name)
+    )
+
+
+def load(name):
+    """
+    Load the preprocessed table called name (e.g. "costs"), from the
+    columnar format if present, otherwise from its pickle (see read_frame).
+    """
+    if os.path.isdir(name + ".columns"):
+        return read_columns(name + ".columns")
+    return Table.from_frame(read_frame(name), sources[name])
+
+
+class LazyTable:
+    """
+    A preprocessed table (see load) that is only read on first use.
+    Attributes other than its own (get, dims...) are those of the loaded
+    Table, so a LazyTable can stand in for one.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.table = None
+        self.load_seconds = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        """ Load the table, unless it already is; returns it """
+        if self.table is None:
+            with self.lock:
+                if self.table is None:
+                    start = time.perf_counter()
+                    table = load(self.name)
+                    self.load_seconds = time.perf_counter() - start
+                    self.table = table
+        return self.table
+
+    def available(self):
+        """ Whether the table is loaded or can be """
+        return self.table is not None or exists(self.name)
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+
+# The preprocessed tables used by the app, loaded on first use.
+tables = {name: LazyTable(name) for name in sources}
+
+
+def preload():
+    """
+    Load all of the available tables now; returns their load times
+    (seconds).
+    """
+    for table in tables.values():
+        if table.available():
+            table.load()
+    return load_times()
+
+
+def load_times():
+    """ Load time (seconds) of each table loaded so far """
+    return {
+        name: table.load_seconds
+        for name, table in tables.items()
+        if table.load_seconds is not None
+    }
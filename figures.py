@@ -0,0 +1,349 @@
+# pylint: disable=C0103,E0401,R0913,C0330,too-many-locals
+"""
+Figures for the JFSP app.
+
+Each generate_* function builds the Plotly figure for one graph from the
+preprocessed tables.  They are plain functions of the GUI inputs so they
+can be called by the Dash callbacks (see application.py) and ahead of time
+(see preprocess/precompute.py).
+
+"""
+import itertools
+import plotly.graph_objs as go
+from plotly.colors import DEFAULT_PLOTLY_COLORS
+import pandas as pd
+import luts
+import data
+import metrics
+
+# Loaded on first use, see data.py.
+total_area_burned = data.tables["total_area_burned"]
+total_area_burned_quantiles = data.tables["total_area_burned_quantiles"]
+total_area_burned_rolling_std = data.tables["total_area_burned_rolling_std"]
+veg_counts = data.tables["veg_counts"]
+costs = data.tables["costs"]
+
+
+def generate_total_area_burned(region, scenario, treatment_options):
+    """ Regenerate plot data for area burned """
+    data_traces = []
+
+    # Subset historical data
+    h = total_area_burned.get(
+        region=region, scenario="", model="", treatment=luts.historical_categories[1]
+    )
+
+    # For each trace, draw a box plot but don't repeat the
+    # plots for historical stuff.  Use a counter to decide
+    # if to trim the data set.
+    counter = 0
+    for treatment in treatment_options:
+        t = total_area_burned.get(
+            region=region, scenario=scenario, model=luts.MODEL_AVG, treatment=treatment
+        )
+
+        t = pd.concat([h, t])
+        if counter > 0:
+            t = t[(t.index >= 2010) & (t.index <= 2100)]
+
+        # Label each year with its decade, which
+        # is what Dash wants as x for box plots.
+        dt = t.assign(decade=t.index // 10 * 10)
+
+        with metrics.phase("build"):
+            data_traces.extend(
+                [
+                    go.Box(
+                        name="Area burned, " + luts.treatment_options[treatment],
+                        x=dt.decade,
+                        y=luts.to_acres_array(dt.area),
+                    )
+                ]
+            )
+        counter += 1
+
+    with metrics.phase("build"):
+        graph_layout = go.Layout(
+            title="Total area burned, "
+            + luts.regions[region]
+            + ", "
+            + luts.scenarios[scenario]
+            + ", "
+            + luts.MODEL_AVG_LABEL,
+            showlegend=True,
+            legend_orientation="h",
+            boxmode="group",
+            legend={"font": {"family": "Open Sans", "size": 10}, "y": -0.15},
+            xaxis={"title": "Year"},
+            yaxis={"title": "Acres", "range": [0, 1900000]},
+            height=550,
+            margin={"l": 50, "r": 50, "b": 50, "t": 50, "pad": 4},
+        )
+    return {"data": data_traces, "layout": graph_layout}
+
+
+def generate_replicate_spread(region, scenario, treatment_options):
+    """
+    Spread of area burned across simulation replicates: the median, with
+    bands for the 25th-75th and 5th-95th percentiles, for each year.
+    """
+    data_traces = []
+
+    # Historical first, then each treatment option.  The quantiles are
+    # only built from the source data (see preprocess/quantiles.py), so
+    # without them the graph is left empty, with a note.
+    available = total_area_burned_quantiles.available()
+    runs = []
+    if available:
+        runs.append(("", "", luts.historical_categories[1], "Historical"))
+        runs += [
+            (scenario, luts.MODEL_AVG, treatment, luts.treatment_options[treatment])
+            for treatment in treatment_options
+        ]
+    for run, (run_scenario, model, treatment, name) in enumerate(runs):
+        q = total_area_burned_quantiles.get(
+            region=region, scenario=run_scenario, model=model, treatment=treatment
+        )
+        years = q.index.tolist()
+        color = DEFAULT_PLOTLY_COLORS[run % len(DEFAULT_PLOTLY_COLORS)]
+        with metrics.phase("build"):
+            for low, high, opacity in [("p5", "p95", 0.2), ("p25", "p75", 0.4)]:
+                data_traces.extend(
+                    [
+                        go.Scatter(
+                            x=years,
+                            y=luts.to_acres_array(q[low]),
+                            mode="lines",
+                            line={"width": 0, "color": color},
+                            legendgroup=treatment,
+                            showlegend=False,
+                            hoverinfo="skip",
+                        ),
+                        go.Scatter(
+                            x=years,
+                            y=luts.to_acres_array(q[high]),
+                            mode="lines",
+                            line={"width": 0, "color": color},
+                            fill="tonexty",
+                            fillcolor=color.replace("rgb(", "rgba(").replace(
+                                ")", ", {})".format(opacity)
+                            ),
+                            legendgroup=treatment,
+                            name=name + ", " + low + "-" + high,
+                        ),
+                    ]
+                )
+            data_traces.append(
+                go.Scatter(
+                    x=years,
+                    y=luts.to_acres_array(q["median"]),
+                    mode="lines",
+                    line={"color": color},
+                    legendgroup=treatment,
+                    name=name + ", median",
+                )
+            )
+
+    with metrics.phase("build"):
+        graph_layout = go.Layout(
+            title="Area burned across replicates, "
+            + luts.regions[region]
+            + ", "
+            + luts.scenarios[scenario]
+            + ", "
+            + luts.MODEL_AVG_LABEL,
+            showlegend=True,
+            legend_orientation="h",
+            legend={"font": {"family": "Open Sans", "size": 10}, "y": -0.15},
+            xaxis={"title": "Year"},
+            yaxis={"title": "Acres"},
+            height=550,
+            margin={"l": 50, "r": 50, "b": 50, "t": 50, "pad": 4},
+        )
+        if not available:
+            graph_layout.update(
+                annotations=[
+                    {
+                        "text": "Replicate quantiles have not been preprocessed",
+                        "xref": "paper",
+                        "yref": "paper",
+                        "showarrow": False,
+                    }
+                ]
+            )
+    return {"data": data_traces, "layout": graph_layout}
+
+
+def generate_ia(
+    region, scenario, treatment_options, window=luts.default_rolling_window
+):
+    """
+    Regenerate plot data for inter-annual variability: the rolling std
+    of area burned, precomputed for each of luts.rolling_windows.
+    """
+    data_traces = []
+
+    for treatment in treatment_options:
+        t = total_area_burned_rolling_std.get(
+            region=region, scenario=scenario, model=luts.MODEL_AVG, treatment=treatment
+        )
+
+        # Only years where the whole window fits.
+        rolling_std = t["std_" + str(window)].dropna()
+
+        data_traces.extend(
+            [
+                {
+                    "x": rolling_std.index.tolist(),
+                    "y": luts.to_acres_array(rolling_std),
+                    "type": "line",
+                    "name": ", ".join(
+                        [
+                            str(window)
+                            + "-year rolling standard deviation, "
+                            + luts.treatment_options[treatment]
+                        ]
+                    ),
+                },
+            ]
+        )
+
+    with metrics.phase("build"):
+        graph_layout = go.Layout(
+            title="Inter-annual variability, "
+            + luts.regions[region]
+            + ", "
+            + luts.scenarios[scenario]
+            + ", "
+            + luts.MODEL_AVG_LABEL,
+            showlegend=True,
+            legend_orientation="h",
+            boxmode="group",
+            legend={"font": {"family": "Open Sans", "size": 10}, "y": -0.15},
+            xaxis={"title": "Year"},
+            yaxis={"title": "Acres"},
+            height=550,
+            margin={"l": 50, "r": 50, "b": 50, "t": 50, "pad": 4},
+        )
+    return {"data": data_traces, "layout": graph_layout}
+
+
+def generate_veg_counts(region, scenario, treatment_options):
+    """ Display veg count graph """
+    data_traces = []
+
+    # Future!
+    for treatment in treatment_options:
+        vc = veg_counts.get(
+            region=region, scenario=scenario, model=luts.MODEL_AVG, treatment=treatment
+        )
+        data_traces.extend(
+            [
+                {
+                    "x": vc.index.tolist(),
+                    "y": vc["coniferous"] / vc["deciduous"],
+                    "type": "line",
+                    "name": ", ".join(
+                        [
+                            luts.treatment_options[treatment],
+                            luts.scenarios[scenario],
+                            luts.MODEL_AVG_LABEL,
+                        ]
+                    ),
+                }
+            ]
+        )
+
+    with metrics.phase("build"):
+        graph_layout = go.Layout(
+            title="Ratio of Coniferous to Deciduous, by area, "
+            + luts.regions[region]
+            + ", "
+            + luts.scenarios[scenario]
+            + ", "
+            + luts.MODEL_AVG_LABEL,
+            showlegend=True,
+            legend={"font": {"family": "Open Sans", "size": 10}, "y": -0.15},
+            xaxis={"title": "Year"},
+            height=550,
+            legend_orientation="h",
+            yaxis={"title": "Coniferous/Deciduous"},
+            margin={"l": 50, "r": 50, "b": 50, "t": 50, "pad": 4},
+        )
+    return {"data": data_traces, "layout": graph_layout}
+
+
+def generate_costs(scenario, treatment_options, option):
+    """ Generate costs graph """
+    data_traces = []
+
+    for treatment in treatment_options:
+        hc = costs.get(
+            scenario=scenario, model=luts.MODEL_AVG, treatment=treatment, option=option
+        )
+        dt = hc.assign(decade=hc.index // 10 * 10)
+
+        with metrics.phase("build"):
+            data_traces.extend(
+                [go.Box(name=luts.treatment_options[treatment], x=dt.decade, y=dt.cost)]
+            )
+
+    if option == "total":
+        title_option = "Total Costs"
+    else:
+        title_option = luts.fmo_options[option] + " Option"
+
+    with metrics.phase("build"):
+        graph_layout = go.Layout(
+            title="Future Costs, Full Model Domain, " + title_option,
+            showlegend=True,
+            height=550,
+            legend_orientation="h",
+            boxmode="group",
+            legend={"font": {"family": "Open Sans", "size": 10}, "y": -0.15},
+            xaxis={"title": "Year"},
+            yaxis={"title": "Cost ($)"},
+            margin={"l": 50, "r": 50, "b": 50, "t": 50, "pad": 4},
+        )
+    return {"data": data_traces, "layout": graph_layout}
+
+
+def treatment_subsets():
+    """ Every selection of the treatment options checklist, including none """
+    return [
+        list(subset)
+        for size in range(len(luts.treatment_options) + 1)
+        for subset in itertools.combinations(luts.treatment_options, size)
+    ]
+
+
+def input_space(builder):
+    """ All valid argument tuples for a figure builder """
+    if builder is generate_costs:
+        return itertools.product(
+            luts.scenarios, treatment_subsets(), list(luts.fmo_options) + ["total"]
+        )
+    if builder is generate_ia:
+        return itertools.product(
+            luts.regions, luts.scenarios, treatment_subsets(), luts.rolling_windows
+        )
+    return itertools.product(luts.regions, luts.scenarios, treatment_subsets())
+
+
+# Figure builders, by the id of the graph they draw.
+builders = {
+    "total_area_burned": generate_total_area_burned,
+    "replicate_spread": generate_replicate_spread,
+    "ia": generate_ia,
+    "veg_counts": generate_veg_counts,
+    "costs": generate_costs,
+}
+
+# Tables each figure builder reads (see data.sources), by graph id.
+builder_tables = {
+    "total_area_burned": ["total_area_burned"],
+    "replicate_spread": ["total_area_burned_quantiles"],
+    "ia": ["total_area_burned_rolling_std"],
+    "veg_counts": ["veg_counts"],
+    "costs": ["costs"],
+}
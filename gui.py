@@ -10,10 +10,7 @@ import dash_html_components as html
 import dash_dangerously_set_inner_html as ddsih
 import luts
 
-models = luts.models
-models["5modelavg"] = "5-Model Average"
-fmos = luts.fmo_options
-fmos["total"] = "Total Costs"
+fmos = dict(luts.fmo_options, total="Total Costs")
 
 path_prefix = os.environ["REQUESTS_PATHNAME_PREFIX"]
 
@@ -46,6 +43,24 @@ fmo_radio_field = html.Div(
     ],
 )
 
+rolling_window_radio = dcc.RadioItems(
+    labelClassName="radio",
+    id="rolling_window_radio",
+    className="control horizontal",
+    options=[
+        {"label": str(window) + "-year window", "value": window}
+        for window in luts.rolling_windows
+    ],
+    value=luts.default_rolling_window,
+)
+rolling_window_radio_field = html.Div(
+    className="field",
+    children=[
+        html.Label("Rolling window", className="label hidden"),
+        rolling_window_radio,
+    ],
+)
+
 region_dropdown = dcc.Dropdown(
     id="region",
     options=[{"label": luts.regions[key], "value": key} for key in luts.regions],
@@ -203,6 +218,13 @@ The chart below shows total area burned for the selected region, including the h
 
 ''', className="about is-size-5 content")
 
+spread_graph_layout = html.Div(className="graph", children=[dcc.Graph(id="replicate_spread")])
+about_spread = dcc.Markdown('''
+
+Each model run is repeated many times (replicates).  The chart below shows how much area burned varies across replicates: the line is the median, and the shaded bands cover the middle 50% and 90% of replicates.
+
+''', className="about is-size-5 content")
+
 ia_graph_layout = html.Div(className="graph", children=[dcc.Graph(id="ia")])
 about_ia = dcc.Markdown('''
 
@@ -259,8 +281,12 @@ layout = html.Div(
                 html.H4("Total area burned", className="title is-4 first"),
                 about_area,
                 html.Div(className="wrapper", children=[graph_layout]),
+                html.H4("Variation across replicates", className="title is-4 first"),
+                about_spread,
+                html.Div(className="wrapper", children=[spread_graph_layout]),
                 html.H4("Inter-annual variability", className="title is-4 first"),
                 about_ia,
+                rolling_window_radio_field,
                 html.Div(className="wrapper", children=[ia_graph_layout]),
                 html.H4("Vegetation type ratio", className="title is-4"),
                 about_veg,
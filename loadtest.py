@@ -0,0 +1,322 @@
+# pylint: disable=C0103,E0401
+"""
+Offline load test of the JFSP app's Dash callbacks.
+
+Simulated users replay what a browser sends to _dash-update-component:
+the callbacks fired when the page loads, then a sequence of input changes
+(region, scenario, treatments, FMO option, rolling window) drawn at random
+from luts.py, each followed by a POST for every callback that depends on
+the changed input, carrying the current values of all of its inputs.
+The callbacks are read from the app itself, so the requests follow its
+configuration: e.g. one request for the region figures with
+COMBINED_CALLBACK, or with CLIENTSIDE a GET of the data bundle per page
+load and no callback requests at all.
+
+Everything runs against the Flask `application` object, with no server or
+network: the app is imported once, and for each worker count that many
+processes are forked from it (as gunicorn --preload does), each running
+the given number of threads with their own test client.  Each run starts
+from cold caches.  Reports throughput, latency percentiles and error rates
+for each combination of workers and threads.
+
+Run from a directory holding the preprocessed tables:
+
+    python loadtest.py --workers 1 2 4 --threads 1 4 --duration 10
+
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import multiprocessing
+import numpy as np
+
+# Absolute, as for benchmark.py.
+repo_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(repo_dir, "preprocess"))
+
+import luts  # pylint: disable=wrong-import-position
+
+# How often a user changes each input, relative to the others.
+action_weights = {
+    "region": 35,
+    "scenarios_checklist": 20,
+    "treatment_options_checklist": 25,
+    "fmo_radio": 10,
+    "rolling_window_radio": 10,
+}
+
+# Input values when the page loads, by component id; set by main()
+# before forking the workers.
+initial_values_cache = {}
+
+
+def choose(rng, component):
+    """ A random new value for an input component """
+    if component == "region":
+        return rng.choice(list(luts.regions))
+    if component == "scenarios_checklist":
+        return rng.choice(list(luts.scenarios))
+    if component == "treatment_options_checklist":
+        treatments = list(luts.treatment_options)
+        return sorted(rng.sample(treatments, rng.randint(1, len(treatments))))
+    if component == "fmo_radio":
+        return rng.choice(list(luts.fmo_options) + ["total"])
+    if component == "rolling_window_radio":
+        return rng.choice(luts.rolling_windows)
+    raise ValueError("No values for " + component)
+
+
+def initial_values(component, values=None):
+    """ The value of each input component in the layout, by id """
+    values = {} if values is None else values
+    if getattr(component, "id", None) is not None and hasattr(component, "value"):
+        values[component.id] = component.value
+    children = getattr(component, "children", None)
+    if not isinstance(children, (list, tuple)):
+        children = [children]
+    for child in children:
+        if hasattr(child, "to_plotly_json"):
+            initial_values(child, values)
+    return values
+
+
+def outputs(output):
+    """ {"id", "property"} of each output in a callback_map key """
+    if output.startswith(".."):
+        names = output[2:-2].split("...")
+    else:
+        names = [output]
+    result = [dict(zip(["id", "property"], name.rsplit(".", 1))) for name in names]
+    return result if output.startswith("..") else result[0]
+
+
+def server_callbacks(app):
+    """
+    The callbacks the browser asks the server for: (output key, list of
+    input {"id", "property"}), leaving out clientside callbacks.
+    """
+    return [
+        (output, [dict(item) for item in spec["inputs"]])
+        for output, spec in app.callback_map.items()
+        if "callback" in spec
+    ]
+
+
+def request_body(output, inputs, values, changed):
+    """ A _dash-update-component request, as dash-renderer sends it """
+    return {
+        "output": output,
+        "outputs": outputs(output),
+        "inputs": [dict(item, value=values[item["id"]]) for item in inputs],
+        "changedPropIds": [changed + ".value"] if changed else [],
+        "state": [],
+    }
+
+
+def timed(record, name, request):
+    """ Make a request, and record its name, time and success """
+    start = time.perf_counter()
+    try:
+        ok = 200 <= request().status_code < 300
+    except Exception:  # pylint: disable=broad-except
+        ok = False
+    record(name, time.perf_counter() - start, ok)
+
+
+def session(client, path, callbacks, pages, rng, actions, think, record):
+    """
+    One user: a page load (GETs of pages, then the callbacks), then
+    actions input changes.  record is called with (output or page,
+    seconds, ok) for each request.
+    """
+    values = initial_values_cache.copy()
+
+    def fire(changed):
+        for output, inputs in callbacks:
+            if changed is not None and all(item["id"] != changed for item in inputs):
+                continue
+            body = request_body(output, inputs, values, changed)
+            timed(record, output, lambda: client.post(path, json=body))
+
+    for page in pages:
+        timed(record, page, lambda: client.get(page))
+    fire(None)
+    components = list(action_weights)
+    weights = [action_weights[component] for component in components]
+    for _ in range(actions):
+        if think:
+            time.sleep(rng.expovariate(1 / think))
+        changed = rng.choices(components, weights)[0]
+        values[changed] = choose(rng, changed)
+        fire(changed)
+
+
+def worker(number, threads, args, results):
+    """ A worker process: threads simulated users until the deadline """
+    # pylint: disable=import-outside-toplevel
+    import application
+
+    path = application.app.config.routes_pathname_prefix + "_dash-update-component"
+    callbacks = server_callbacks(application.app)
+    # In clientside mode, each page load fetches the data bundle instead.
+    pages = []
+    if application.clientside:
+        pages.append(application.app.config.routes_pathname_prefix + "data-bundle.json")
+    lock = threading.Lock()
+    latencies, outputs_seen, errors = [], [], [0]
+    deadline = time.perf_counter() + args.duration
+
+    def record(output, seconds, ok):
+        with lock:
+            latencies.append(seconds)
+            outputs_seen.append(output)
+            if not ok:
+                errors[0] += 1
+
+    def user(thread):
+        client = application.application.test_client()
+        rng = random.Random(args.seed * 1000003 + number * 1009 + thread)
+        while time.perf_counter() < deadline:
+            session(
+                client, path, callbacks, pages, rng, args.actions, args.think, record
+            )
+
+    start = time.perf_counter()
+    pool = [threading.Thread(target=user, args=(thread,)) for thread in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    results.put(
+        {
+            "elapsed": time.perf_counter() - start,
+            "latencies": latencies,
+            "outputs": outputs_seen,
+            "errors": errors[0],
+        }
+    )
+
+
+def percentiles(seconds):
+    """ Latency percentiles in ms """
+    if not seconds:
+        return {}
+    ms = np.array(seconds) * 1000
+    result = {"p" + str(q): float(np.percentile(ms, q)) for q in (50, 90, 95, 99)}
+    result["max"] = float(ms.max())
+    return {name: round(value, 3) for name, value in result.items()}
+
+
+def run(workers, threads, args):
+    """ One load test run; returns its summary """
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    processes = [
+        context.Process(target=worker, args=(number, threads, args, results))
+        for number in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    reports = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    latencies = [value for report in reports for value in report["latencies"]]
+    outputs_seen = [value for report in reports for value in report["outputs"]]
+    errors = sum(report["errors"] for report in reports)
+    elapsed = max(report["elapsed"] for report in reports)
+    by_output = {}
+    for output, seconds in zip(outputs_seen, latencies):
+        by_output.setdefault(output, []).append(seconds)
+    return {
+        "workers": workers,
+        "threads": threads,
+        "requests": len(latencies),
+        "errors": errors,
+        "error_rate": errors / len(latencies) if latencies else 0.0,
+        "throughput": len(latencies) / elapsed,
+        "latency_ms": percentiles(latencies),
+        "outputs": {
+            output: dict(requests=len(seconds), latency_ms=percentiles(seconds))
+            for output, seconds in sorted(by_output.items())
+        },
+    }
+
+
+def main():
+    """ Run the load test for each combination of workers and threads """
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--workers", type=int, nargs="+", default=[1], help="worker processes"
+    )
+    parser.add_argument(
+        "--threads", type=int, nargs="+", default=[1], help="threads per worker"
+    )
+    parser.add_argument(
+        "--duration", type=float, default=10, help="seconds per run (default: 10)"
+    )
+    parser.add_argument(
+        "--actions", type=int, default=20, help="input changes per session"
+    )
+    parser.add_argument(
+        "--think",
+        type=float,
+        default=0,
+        help="mean seconds between a user's actions (default: 0, flat out)",
+    )
+    parser.add_argument("--seed", type=int, default=luts.random_seed)
+    parser.add_argument("--json", metavar="PATH", help="also write results as JSON")
+    args = parser.parse_args()
+
+    # A synthetic tree may have scaled the tables, see preprocess/synthetic.py.
+    import synthetic  # pylint: disable=import-outside-toplevel
+
+    synthetic.apply("data")
+    os.environ.setdefault("REQUESTS_PATHNAME_PREFIX", "/")
+    import application  # pylint: disable=import-outside-toplevel
+
+    initial_values_cache.update(initial_values(application.app.layout))
+
+    print(
+        "{:>7} {:>7} {:>9} {:>8} {:>9} {:>9} {:>9} {:>9}".format(
+            "workers",
+            "threads",
+            "requests",
+            "errors",
+            "req/s",
+            "p50 ms",
+            "p95 ms",
+            "p99 ms",
+        )
+    )
+    summaries = []
+    for workers in args.workers:
+        for threads in args.threads:
+            summary = run(workers, threads, args)
+            summaries.append(summary)
+            latency = summary["latency_ms"]
+            print(
+                "{:>7} {:>7} {:>9} {:>7.2%} {:>9.1f} {:>9.2f} {:>9.2f} {:>9.2f}".format(
+                    workers,
+                    threads,
+                    summary["requests"],
+                    summary["error_rate"],
+                    summary["throughput"],
+                    latency.get("p50", 0),
+                    latency.get("p95", 0),
+                    latency.get("p99", 0),
+                )
+            )
+    if args.json:
+        with open(args.json, "w") as results_file:
+            json.dump({"config": vars(args), "runs": summaries}, results_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,10 +5,12 @@ Lookup tables with key names and human-readable names
 
 # Fragments used in the data preprocessing scripts.
 import pandas as pd
+import numpy as np
 import math
 
 STATEWIDE = "AllFMZs"
 MODEL_AVG = "5modelavg"
+MODEL_AVG_LABEL = "5-Model Average"
 fmo_prefix = "fmo99s95i"
 historical_fmo_prefix = "fmo99s95i_historical_CRU32"
 date_postfix = "2014_2099"
@@ -18,12 +20,33 @@ historical_year_range = pd.RangeIndex(start=1950, stop=2014)
 future_year_range = pd.RangeIndex(start=2014, stop=2100)
 random_seed = 42  # random seed for reproducible random numbers
 
+# Windows (years) of the rolling standard deviations precomputed for the
+# inter-annual variability chart, and the one it shows by default.
+rolling_windows = [5, 10, 20]
+default_rolling_window = 10
+
+ACRES_PER_KM2 = 247.11
+
 # Helper functions.
 def to_acres(km2):
     """ square KM to acres """
     if math.isnan(km2):
         return 0
-    return round(km2 * 247.11)
+    return round(km2 * ACRES_PER_KM2)
+
+
+def to_acres_array(km2):
+    """
+    Vectorized to_acres for a scalar, ndarray or Series: NaN becomes 0,
+    and values are rounded half to even, as round() does.
+    """
+    acres = np.rint(np.asarray(km2, dtype=np.float64) * ACRES_PER_KM2)
+    acres = np.where(np.isnan(acres), 0, acres).astype(np.int64)
+    if isinstance(km2, pd.Series):
+        return pd.Series(acres, index=km2.index, name=km2.name)
+    if acres.ndim == 0:
+        return int(acres)
+    return acres
 
 
 zones = {
@@ -90,3 +113,13 @@ fmo_costs = {
 }
 
 fmo_options = {"C": "Critical", "F": "Full", "L": "Limited"}
+
+# Fixed category orders for the dimension columns of the preprocessed
+# tidy tables, which are stored as pandas Categoricals.
+categories = {
+    "treatment": historical_categories + list(treatment_options),
+    "scenario": ["historical"] + list(scenarios),
+    "model": [""] + list(models) + [MODEL_AVG],
+    "region": list(regions),
+    "option": list(fmo_options) + ["total"],
+}
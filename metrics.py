@@ -0,0 +1,286 @@
+# pylint: disable=C0103,E0401
+"""
+Latency instrumentation for the Dash callbacks, exposed at /metrics in
+the Prometheus text format.
+
+Each figure built (rather than served from a cache) is split into phases:
+
+ * filter: looking up the series it draws (data.Table.get), which also
+   counts the rows touched;
+ * build: constructing the Plotly objects (marked in figures.py);
+ * aggregate: everything else the builder does (concatenating, bucketing,
+   ratios...), i.e. its wall time less the other two.
+
+Each callback request is timed as a whole, and split into the time spent
+in the callback functions and the rest, which is mostly Dash serializing
+the response (plus compressing it, see responses.py).  Requests answered
+by the response cache only have a total.  Cache hit rates are read from
+the caches when /metrics is scraped.
+
+Recording is a few clock reads and dict updates per call, so it is left
+on.  The metrics are per process: with several server workers, each
+scrape sees the worker that answered it.
+
+"""
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from flask import Response, request
+
+# Histogram bucket upper bounds: seconds, and rows touched per figure.
+second_buckets = tuple(
+    ms / 1000 for ms in (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+)
+row_buckets = (10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# The figure or request being timed by the current thread, if any.
+state = threading.local()
+
+
+class Histogram:
+    """ Cumulative counts of observations against fixed buckets """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """ Record one observation (callers hold the registry lock) """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        """ Exposition lines for the histogram """
+        result = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            cumulative += count
+            result.append(
+                "{}_bucket{} {}".format(
+                    name, format_labels(labels + (("le", str(bound)),)), cumulative
+                )
+            )
+        result.append("{}_sum{} {}".format(name, format_labels(labels), self.sum))
+        result.append("{}_count{} {}".format(name, format_labels(labels), self.count))
+        return result
+
+
+def format_labels(labels):
+    """ Prometheus label set for a tuple of (name, value) pairs """
+    if not labels:
+        return ""
+    return (
+        "{"
+        + ",".join(
+            '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+            for name, value in labels
+        )
+        + "}"
+    )
+
+
+class Registry:
+    """ Histograms and counters, by metric name and label set """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.help = {}
+        self.collectors = []
+
+    def observe(self, name, value, buckets=second_buckets, **labels):
+        """ Record value in the named histogram """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name, value=1, **labels):
+        """ Add value to the named counter """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def describe(self, name, text):
+        """ HELP text for a metric """
+        self.help[name] = text
+
+    def collector(self, func):
+        """
+        Register a function called at each scrape, which returns
+        (name, type, labels dict, value) tuples, e.g. for cache sizes.
+        """
+        self.collectors.append(func)
+        return func
+
+    def exposition(self):
+        """ All metrics in the Prometheus text format """
+        families = {}
+        with self.lock:
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                family = families.setdefault(name, ("histogram", []))
+                family[1].extend(histogram.lines(name, labels))
+            for (name, labels), value in sorted(self.counters.items()):
+                family = families.setdefault(name, ("counter", []))
+                family[1].append("{}{} {}".format(name, format_labels(labels), value))
+        for collect in self.collectors:
+            for name, kind, labels, value in collect():
+                family = families.setdefault(name, (kind, []))
+                family[1].append(
+                    "{}{} {}".format(
+                        name, format_labels(tuple(sorted(labels.items()))), value
+                    )
+                )
+        lines = []
+        for name, (kind, samples) in families.items():
+            if name in self.help:
+                lines.append("# HELP {} {}".format(name, self.help[name]))
+            lines.append("# TYPE {} {}".format(name, kind))
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+registry.describe(
+    "jfsp_figure_phase_seconds", "Time building a figure, by builder and phase."
+)
+registry.describe("jfsp_figure_rows", "Table rows touched building a figure.")
+registry.describe(
+    "jfsp_request_seconds",
+    "Callback request time, by output and phase (callback, serialize, total).",
+)
+
+
+def filtered(seconds, rows):
+    """ Called by data.Table.get for each lookup """
+    call = getattr(state, "figure", None)
+    if call is not None:
+        call["filter"] += seconds
+        call["rows"] += rows
+
+
+@contextmanager
+def phase(name):
+    """ Attribute the time spent in the block to a phase of the figure """
+    call = getattr(state, "figure", None)
+    if call is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        call[name] += time.perf_counter() - start
+
+
+def instrument(builder):
+    """ Decorator timing each phase of a figure builder """
+
+    @wraps(builder)
+    def wrapper(*args, **kwargs):
+        if getattr(state, "figure", None) is not None:
+            return builder(*args, **kwargs)
+        state.figure = call = {"filter": 0.0, "build": 0.0, "rows": 0}
+        start = time.perf_counter()
+        try:
+            return builder(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            state.figure = None
+            name = builder.__name__
+            registry.observe(
+                "jfsp_figure_phase_seconds",
+                call["filter"],
+                builder=name,
+                phase="filter",
+            )
+            registry.observe(
+                "jfsp_figure_phase_seconds", call["build"], builder=name, phase="build"
+            )
+            registry.observe(
+                "jfsp_figure_phase_seconds",
+                max(elapsed - call["filter"] - call["build"], 0.0),
+                builder=name,
+                phase="aggregate",
+            )
+            registry.observe(
+                "jfsp_figure_rows", call["rows"], buckets=row_buckets, builder=name
+            )
+
+    return wrapper
+
+
+def timed_callback(func):
+    """
+    Decorator for a function a Dash callback calls, so its time counts
+    towards the request's "callback" phase.
+    """
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            timing = getattr(state, "request", None)
+            if timing is not None:
+                timing["callback"] = (timing["callback"] or 0.0) + (
+                    time.perf_counter() - start
+                )
+
+    return wrapper
+
+
+def before_request():
+    """ Start timing a callback request """
+    if request.method == "POST" and request.path.endswith("_dash-update-component"):
+        state.request = {"start": time.perf_counter(), "callback": None}
+    else:
+        state.request = None
+
+
+def after_request(response):
+    """ Record the phases of a callback request """
+    timing = getattr(state, "request", None)
+    state.request = None
+    if timing is None:
+        return response
+    total = time.perf_counter() - timing["start"]
+    body = request.get_json(silent=True)
+    output = body.get("output") if isinstance(body, dict) else None
+    registry.observe("jfsp_request_seconds", total, output=output, phase="total")
+    if timing["callback"] is not None:
+        registry.observe(
+            "jfsp_request_seconds", timing["callback"], output=output, phase="callback"
+        )
+        registry.observe(
+            "jfsp_request_seconds",
+            max(total - timing["callback"], 0.0),
+            output=output,
+            phase="serialize",
+        )
+    return response
+
+
+def serve_metrics():
+    """ The /metrics endpoint """
+    return Response(registry.exposition(), mimetype="text/plain; version=0.0.4")
+
+
+def init_app(server, path="/metrics"):
+    """
+    Register the request timing hooks and the metrics route on a Flask
+    server.  Call before installing other hooks that may answer requests
+    (e.g. the response cache), so that those requests are timed too.
+    """
+    server.before_request(before_request)
+    server.after_request(after_request)
+    server.add_url_rule(path, "metrics", serve_metrics)
@@ -0,0 +1,153 @@
+# pylint: disable=C0103,E0401
+"""
+Slimmed figure payloads.
+
+The figures built in figures.py carry more data than the browser needs:
+box traces send every year's value along with a parallel x array that
+repeats each decade ten times, and line traces send a full list of
+years.  slim() rewrites a figure so that
+
+ * box traces carry precomputed statistics (q1, median, q3 and fences,
+   as plotly.js would compute them) for one x per box, instead of raw
+   points.  Outliers are no longer drawn as points;
+ * evenly spaced x arrays of other traces become x0 and dx;
+ * numeric arrays are sent as base64 typed arrays, if the plotly.js
+   served by dash-core-components supports them (2.28 and later).
+
+The figures look the same otherwise.  Enabled in application.py by
+the SLIM_FIGURES environment variable.
+
+"""
+import os
+import re
+import math
+import glob
+import base64
+from functools import lru_cache
+import numpy as np
+
+
+@lru_cache(maxsize=None)
+def plotly_js_version():
+    """
+    Version, as a tuple of ints, of the plotly.js bundled with
+    dash-core-components, or None if it can't be found.
+    """
+    try:
+        from dash import dcc  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        import dash_core_components as dcc  # pylint: disable=import-outside-toplevel
+    for path in glob.glob(os.path.join(os.path.dirname(dcc.__file__), "plotly*.js")):
+        with open(path, encoding="utf-8", errors="ignore") as bundle:
+            match = re.search(r"plotly\.js v(\d+)\.(\d+)\.(\d+)", bundle.read(512))
+        if match:
+            return tuple(int(part) for part in match.groups())
+    return None
+
+
+def typed_arrays_supported():
+    """ Whether the plotly.js in use decodes base64 typed arrays """
+    version = plotly_js_version()
+    return version is not None and version >= (2, 28)
+
+
+def interp(values, fraction):
+    """ Quantile of sorted values, interpolated as plotly.js does """
+    n = fraction * len(values) - 0.5
+    if n < 0:
+        return values[0]
+    if n > len(values) - 1:
+        return values[-1]
+    frac = n % 1
+    return frac * values[math.ceil(n)] + (1 - frac) * values[math.floor(n)]
+
+
+def box_stats(values):
+    """
+    Box statistics of values as plotly.js computes them for a box
+    showing outliers: quartiles by linear interpolation, and fences at the
+    furthest values within 1.5 interquartile ranges of the box.
+    """
+    values = np.sort(np.asarray(values, dtype=float))
+    q1, median, q3 = (interp(values, fraction) for fraction in (0.25, 0.5, 0.75))
+    iqr = q3 - q1
+    return {
+        "q1": q1,
+        "median": median,
+        "q3": q3,
+        "lowerfence": min(q1, values[values >= q1 - 1.5 * iqr].min()),
+        "upperfence": max(q3, values[values <= q3 + 1.5 * iqr].max()),
+    }
+
+
+def slim_box(trace):
+    """ Replace the raw points of a box trace with per-box statistics """
+    x = np.asarray(trace.pop("x"))
+    y = np.asarray(trace.pop("y"))
+    positions = np.unique(x)
+    stats = [box_stats(y[x == position]) for position in positions]
+    trace["x"] = positions
+    for stat in ["q1", "median", "q3", "lowerfence", "upperfence"]:
+        trace[stat] = np.array([box[stat] for box in stats])
+    return trace
+
+
+def slim_x(trace):
+    """ Replace an evenly spaced x array with x0 and dx """
+    x = np.asarray(trace["x"])
+    if len(x) > 1 and np.issubdtype(x.dtype, np.number):
+        steps = np.diff(x)
+        if (steps == steps[0]).all():
+            del trace["x"]
+            trace["x0"] = x[0].item()
+            trace["dx"] = steps[0].item()
+    return trace
+
+
+def typed_array(values):
+    """
+    A numeric array as a plotly.js typed array spec, or as a list if
+    its values can't be sent exactly.
+    """
+    if np.issubdtype(values.dtype, np.integer):
+        if len(values) and np.abs(values).max() >= 2**31:
+            return values.tolist()
+        dtype = "i4"
+    else:
+        dtype = "f8"
+    return {
+        "dtype": dtype,
+        "bdata": base64.b64encode(values.astype("<" + dtype).tobytes()).decode(),
+    }
+
+
+def encode_arrays(trace, typed_arrays):
+    """ Numeric arrays of a trace as typed arrays, or lists """
+    for key, value in trace.items():
+        if isinstance(value, (list, tuple, np.ndarray)) or hasattr(value, "to_numpy"):
+            array = np.asarray(value)
+            if array.ndim == 1 and np.issubdtype(array.dtype, np.number):
+                if array.dtype.kind == "f" and (np.mod(array, 1) == 0).all():
+                    array = array.astype(np.int64)  # e.g. 1234 for 1234.0
+                trace[key] = typed_array(array) if typed_arrays else array.tolist()
+    return trace
+
+
+def slim(figure, typed_arrays=None):
+    """
+    A slimmed copy of a figure ({"data": traces, "layout": layout}).
+    typed_arrays defaults to whether the plotly.js in use supports them.
+    """
+    if typed_arrays is None:
+        typed_arrays = typed_arrays_supported()
+    traces = []
+    for trace in figure["data"]:
+        trace = dict(
+            trace.to_plotly_json() if hasattr(trace, "to_plotly_json") else trace
+        )
+        if trace.get("type") == "box" and "x" in trace and "y" in trace:
+            trace = slim_box(trace)
+        elif "x" in trace:
+            trace = slim_x(trace)
+        traces.append(encode_arrays(trace, typed_arrays))
+    return {"data": traces, "layout": figure["layout"]}
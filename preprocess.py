@@ -3,20 +3,107 @@
 Preprocess Alfresco data into shapes that can
 be easily used by JFSP app.
 
-"""
+Source CSVs are read in a process pool, one worker per CPU by default;
+see `python preprocess.py --help`.
+
+Builds are incremental: the replicate means of each source file (and
+the quantiles of each group of model runs) are cached under
+.preprocess-cache, keyed by content, and a stage whose inputs and
+outputs are unchanged since its last build is skipped.  Only the tables
+derived from the rebuilt ones, and the figures drawn from them, are
+written again.
 
+"""
+import os
 import sys
+import argparse
 
 sys.path.append("./preprocess")
 sys.path.append(".")
 
 import luts
-import area
-import veg
-import cost
+import data
 
 data_dir = "data"
 
-area.process(data_dir)
-veg.process(data_dir)
-cost.process(data_dir)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="number of processes reading source files (default: one per CPU)",
+    )
+    parser.add_argument(
+        "--serial",
+        action="store_true",
+        help="read source files one at a time in this process",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=".preprocess-cache",
+        help="build manifest and per-file cache directory (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="read every source file and rebuild every output",
+    )
+    parser.add_argument(
+        "--synthetic",
+        action="store_true",
+        help="preprocess a synthetic source tree (see preprocess/synthetic.py), "
+        "with the lookup tables scaled to its regions, models and years",
+    )
+    args = parser.parse_args()
+
+    # pylint: disable=import-outside-toplevel
+    if args.synthetic:
+        # Before importing the stages: cost.py maps years to cost
+        # factors when imported.
+        import synthetic
+
+        if synthetic.apply(data_dir) is None:
+            parser.error("no synthetic tree in " + data_dir)
+
+    import ingest
+    import area
+    import veg
+    import cost
+    import quantiles
+    import rolling
+    import columnar
+    import precompute
+
+    ingest.workers = 1 if args.serial else args.workers
+    ingest.cache_dir = None if args.no_cache else args.cache_dir
+
+    # The tables written by each stage.
+    stage_tables = [
+        (area, ["total_area_burned"]),
+        (veg, ["veg_counts"]),
+        (cost, ["costs"]),
+        (quantiles, ["total_area_burned_quantiles"]),
+    ]
+    rebuilt = []
+    for stage, names in stage_tables:
+        if stage.process(data_dir):
+            rebuilt += names
+
+    if "total_area_burned" in rebuilt or not os.path.isfile(
+        "total_area_burned_rolling_std.pickle"
+    ):
+        rolling.process()
+        rebuilt.append("total_area_burned_rolling_std")
+
+    # The columnar tables and figures of the rebuilt tables, and any missing.
+    columnar.process(
+        [
+            name
+            for name in data.sources
+            if name in rebuilt
+            or (data.exists(name) and not os.path.isdir(name + ".columns"))
+        ]
+    )
+    if rebuilt or not os.path.isfile("figures.json.gz"):
+        precompute.process(tables=rebuilt)
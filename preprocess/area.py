@@ -7,6 +7,8 @@ directory, total_area_burned.pickle (and CSV).
 import os
 import pandas as pd
 import luts
+import data
+import ingest
 
 
 def get_source_filename(data_dir, spatial_prefix, treatment, prefix, postfix, region):
@@ -22,22 +24,50 @@ def get_source_filename(data_dir, spatial_prefix, treatment, prefix, postfix, re
     return input_file
 
 
+def source_files(data_dir):
+    """ All source files read by process, in the order they are read """
+    for spatial_prefix, regions in luts.spatial_prefix_map.items():
+        for region in regions:
+            yield get_source_filename(
+                data_dir,
+                spatial_prefix,
+                luts.historical_categories[1],
+                luts.historical_fmo_prefix,
+                luts.historical_date_postfix,
+                region,
+            )
+            for treatment in luts.treatment_options:
+                for scenario in luts.scenarios:
+                    for model in luts.models:
+                        yield get_source_filename(
+                            data_dir,
+                            spatial_prefix,
+                            treatment,
+                            "_".join([luts.fmo_prefix, scenario, model]),
+                            luts.date_postfix,
+                            region,
+                        )
+
+
 def process(data_dir):
     """
     Total area burned: create a table structure with these columns:
 
     year(index), treatment, scenario, model, region, area
     """
+    if not ingest.prefetch(source_files(data_dir), "area"):
+        print("total_area_burned is up to date")
+        return False
 
     cols = ["treatment", "scenario", "model", "region", "area"]
-    total_area_burned = pd.DataFrame(columns=cols)
-    total_area_burned.index.name = "year"
+    regions = [
+        region for regions in luts.spatial_prefix_map.values() for region in regions
+    ]
+    parts = []
 
-    for spatial_prefix, regions in luts.spatial_prefix_map.items():
-        for region in regions:
+    for spatial_prefix, prefix_regions in luts.spatial_prefix_map.items():
+        for region in prefix_regions:
             # Historical
-            t = pd.DataFrame(index=luts.historical_year_range, columns=cols)
-            t = t.assign(treatment=luts.historical_categories[1], region=region)
             input_file = get_source_filename(
                 data_dir,
                 spatial_prefix,
@@ -46,26 +76,16 @@ def process(data_dir):
                 luts.historical_date_postfix,
                 region,
             )
-            d = pd.read_csv(input_file, index_col=0)
-            t["area"] = d.mean(axis=1)
-            total_area_burned = total_area_burned.append(t)
+            t = pd.DataFrame(index=luts.historical_year_range, columns=cols)
+            t = t.assign(treatment=luts.historical_categories[1], region=region)
+            t["area"] = ingest.replicate_mean(input_file)
+            parts.append(t)
 
             # Future
             for treatment in luts.treatment_options:
                 for scenario in luts.scenarios:
                     for model in luts.models:
-
                         prefix = "_".join([luts.fmo_prefix, scenario, model])
-                        filename = "_".join(
-                            [
-                                "alfresco_totalareaburned",
-                                region,
-                                prefix,
-                                luts.date_postfix,
-                            ]
-                        )
-                        filename += ".csv"
-
                         input_file = get_source_filename(
                             data_dir,
                             spatial_prefix,
@@ -74,7 +94,6 @@ def process(data_dir):
                             luts.date_postfix,
                             region,
                         )
-
                         t = pd.DataFrame(index=luts.future_year_range, columns=cols)
                         t = t.assign(
                             treatment=treatment,
@@ -82,76 +101,75 @@ def process(data_dir):
                             model=model,
                             region=region,
                         )
-                        d = pd.read_csv(input_file, index_col=0)
-                        t["area"] = d.mean(axis=1)
-                        total_area_burned = total_area_burned.append(t)
+                        t["area"] = ingest.replicate_mean(input_file)
+                        parts.append(t)
+
+    total_area_burned = pd.concat(parts)
+    total_area_burned.index.name = "year"
+    future = total_area_burned[
+        total_area_burned.treatment != luts.historical_categories[1]
+    ]
 
     # Precompute 5-model-averages.  MEDIAN.
     # Future only.
-    # Create a dataframe with models as columns, then compute median.
-    for spatial_prefix, regions in luts.spatial_prefix_map.items():
-        for region in regions:
-            for treatment in luts.treatment_options:
-                for scenario in luts.scenarios:
-                    t = pd.DataFrame(index=luts.future_year_range, columns=cols)
-                    t = t.assign(
-                        treatment=treatment,
-                        scenario=scenario,
-                        model="5modelavg",
-                        region=region,
-                    )
-                    z = pd.DataFrame(index=luts.future_year_range, columns=luts.models)
-                    for model in luts.models:
-                        z[model] = total_area_burned[
-                            (total_area_burned.region == region)
-                            & (total_area_burned.treatment == treatment)
-                            & (total_area_burned.scenario == scenario)
-                            & (total_area_burned.model == model)
-                        ].area
-
-                    t["area"] = z.median(axis=1)
-                    total_area_burned = total_area_burned.append(t)
+    # Median across models for each region/treatment/scenario/year.
+    medians = future.groupby(["region", "treatment", "scenario", "year"]).area.median()
+    medians = medians.reindex(
+        pd.MultiIndex.from_product(
+            [regions, luts.treatment_options, luts.scenarios, luts.future_year_range],
+            names=medians.index.names,
+        )
+    )
+    medians = medians.reset_index(["region", "treatment", "scenario"])
+    medians = medians.assign(model=luts.MODEL_AVG)[cols]
 
     # Precompute "statewide" totals; for our scenario,
     # "statewide" is the sum of all fire management zones.
-    # Create a dataframe with the FMZs as the columns, then sum.
+    # Pivot to a frame with the FMZs as the columns, then sum.
+    zones = pd.concat([total_area_burned, medians])
+    zones = zones[zones.region.isin(luts.zones)]
+    zones = zones.fillna({"scenario": "", "model": ""})
+    zones = (
+        zones.set_index(["treatment", "scenario", "model", "region"], append=True)
+        .area.unstack("region")
+        .reindex(columns=list(luts.zones))
+    )
+    # Add the zones one at a time, in luts.zones order and skipping missing
+    # values, as summing them zone by zone did.  A row-wise sum of the frame
+    # may add in another order, which changes the last bit of some totals.
+    sums = sum(zones[zone].fillna(0) for zone in luts.zones)
+
     # Historical:
     t = pd.DataFrame(index=luts.historical_year_range, columns=cols)
-    t = t.assign(treatment=luts.historical_categories[1], region="AllFMZs")
-    z = pd.DataFrame(index=luts.historical_year_range, columns=luts.zones)
-    for zone in luts.zones:
-        z[zone] = total_area_burned[
-            (total_area_burned.region == zone)
-            & (total_area_burned.treatment == luts.historical_categories[1])
-        ].area
-
-    t["area"] = z.sum(axis=1)
-    total_area_burned = total_area_burned.append(t)
+    t = t.assign(treatment=luts.historical_categories[1], region=luts.STATEWIDE)
+    t["area"] = sums.xs(
+        (luts.historical_categories[1], "", ""),
+        level=["treatment", "scenario", "model"],
+    )
+    statewide = [t]
 
     # Future "statewide" totals, adding in 5modelavg:
-    models_with_5modelavg = luts.models.copy()
-    models_with_5modelavg.update({"5modelavg": "5modelavg"})
-    for treatment in luts.treatment_options:
-        for scenario in luts.scenarios:
-            for model in models_with_5modelavg:
-                t = pd.DataFrame(index=luts.future_year_range, columns=cols)
-                t = t.assign(
-                    treatment=treatment,
-                    scenario=scenario,
-                    model=model,
-                    region="AllFMZs",
-                )
-                z = pd.DataFrame(index=luts.future_year_range, columns=luts.zones)
-                for zone in luts.zones:
-                    z[zone] = total_area_burned[
-                        (total_area_burned.region == zone)
-                        & (total_area_burned.treatment == treatment)
-                        & (total_area_burned.scenario == scenario)
-                        & (total_area_burned.model == model)
-                    ].area
-
-                t["area"] = z.sum(axis=1)
-                total_area_burned = total_area_burned.append(t)
+    models_with_5modelavg = list(luts.models) + [luts.MODEL_AVG]
+    sums = sums.reorder_levels(["treatment", "scenario", "model", "year"]).reindex(
+        pd.MultiIndex.from_product(
+            [
+                luts.treatment_options,
+                luts.scenarios,
+                models_with_5modelavg,
+                luts.future_year_range,
+            ],
+            names=["treatment", "scenario", "model", "year"],
+        ),
+        fill_value=0,
+    )
+    sums = sums.rename("area").reset_index(["treatment", "scenario", "model"])
+    statewide.append(sums.assign(region=luts.STATEWIDE)[cols])
+
+    total_area_burned = pd.concat([total_area_burned, medians] + statewide)
+    total_area_burned.index.name = None
 
+    data.categorize(total_area_burned)
     total_area_burned.to_pickle("total_area_burned.pickle")
     total_area_burned.to_csv("total_area_burned.csv")
+    ingest.record("area", ["total_area_burned.pickle", "total_area_burned.csv"])
+    return True
@@ -0,0 +1,36 @@
+"""
+Write the preprocessed tables (total_area_burned, veg_counts, costs)
+in the columnar, memory-mappable format read by the app, as
+<name>.columns directories next to their pickles.  See data.py.
+
+Run after the area, veg and cost stages.  Tables without a pickle are
+derived if they can be (see data.read_frame), otherwise skipped (e.g. the
+replicate quantiles, which need the source data).  To convert the
+existing pickles only, run from the repository root:
+
+    python preprocess/columnar.py
+"""
+# pylint: disable=C0103,import-error,wrong-import-position
+
+import sys
+
+sys.path.append(".")
+
+import data
+
+
+def process(names=None):
+    """ Convert each pickled table (or those named) to the columnar format """
+    for name, dims in data.sources.items():
+        if names is not None and name not in names:
+            continue
+        try:
+            frame = data.read_frame(name)
+        except FileNotFoundError:
+            print("Skipping {}: no {}.pickle".format(name, name))
+            continue
+        data.write_columns(frame, name + ".columns", dims)
+
+
+if __name__ == "__main__":
+    process()
@@ -17,14 +17,28 @@ import os
 import numpy as np
 import pandas as pd
 import luts
+import data
+import ingest
 
 # Create seeded pseudorandom map of years to [2011...2016]
 # Save to CSV so this mapping can be checked.
 np.random.seed(luts.random_seed)
-random_cost_map = pd.DataFrame(index=pd.RangeIndex(start=1950, stop=2100))
+random_cost_map = pd.DataFrame(
+    index=pd.RangeIndex(
+        start=luts.historical_year_range.start, stop=luts.future_year_range.stop
+    )
+)
 random_cost_map["year"] = np.random.randint(2011, 2017, random_cost_map.shape[0])
 random_cost_map.to_csv("random_year_map.csv")
 
+# Cost factors (per acre burned) as a year x option table: the row for
+# each year holds the factors of the year it is randomly mapped to.
+cost_factors = (
+    pd.DataFrame.from_dict(luts.fmo_costs, orient="index")
+    .reindex(index=random_cost_map.year, columns=list(luts.fmo_options))
+    .set_index(random_cost_map.index)
+)
+
 
 def get_cost_filename(data_dir, treatment, scenario, model, option):
     """
@@ -66,19 +80,21 @@ def get_cost_filename(data_dir, treatment, scenario, model, option):
     return input_file
 
 
-def compute_row_cost(row):
+def compute_cost(tidied):
     """
     Broken out here for clarity.
 
-    Given a row with year (as index), option, and area burned,
-    look up the corresponding year in the random_cost_map
-    dataframe and use that to fetch the costs from the
-    luts.fmo_costs dict.  Each year is assigned a random
-    map to a prior year of known costs.
+    Given a frame with year (as index), option, and area burned,
+    look up the cost factor for each row's year and option in
+    the cost_factors table.  Each year is assigned a random
+    map to a prior year of known costs (see random_cost_map).
     """
-    mapped_year = random_cost_map.loc[row.name].year
-    cost_factor = luts.fmo_costs[mapped_year][row.option]
-    return round(luts.to_acres(row.area) * cost_factor)
+    factors = cost_factors.to_numpy()[
+        cost_factors.index.get_indexer(tidied.index),
+        cost_factors.columns.get_indexer(tidied.option),
+    ]
+    acres = luts.to_acres_array(tidied.area.to_numpy())
+    return pd.Series(np.rint(acres * factors).astype(np.int64), index=tidied.index)
 
 
 def get_cost_df(data_dir, year_range, treatment, scenario, model):
@@ -91,10 +107,9 @@ def get_cost_df(data_dir, year_range, treatment, scenario, model):
             tidied = tidied.assign(
                 treatment=treatment, scenario=scenario, model=model, option=option
             )
-            temp_costs = pd.read_csv(filename, index_col=0)
-            reps_mean = temp_costs.mean(axis=1)  # compute mean of reps
+            reps_mean = ingest.replicate_mean(filename)  # compute mean of reps
             tidied = tidied.assign(area=reps_mean)
-            tidied["cost"] = tidied.apply(compute_row_cost, axis=1)
+            tidied["cost"] = compute_cost(tidied)
             tidied_costs.append(tidied)
         else:
             print("No FMO file found {}".format(filename))
@@ -103,79 +118,91 @@ def get_cost_df(data_dir, year_range, treatment, scenario, model):
     return tidied_costs
 
 
+def source_files(data_dir):
+    """
+    All source files process may read, in the order they are read.
+    Not all of these exist; see get_cost_df.
+    """
+    combinations = [("cru_tx0", "historical", "")]
+    combinations += [
+        (treatment, scenario, model)
+        for treatment in luts.treatment_options
+        for scenario in luts.scenarios
+        for model in luts.models
+    ]
+    for treatment, scenario, model in combinations:
+        for option in luts.fmo_options:
+            yield get_cost_filename(data_dir, treatment, scenario, model, option)
+
+
 def process(data_dir):
     """ Produce cost estimates. """
+    if not ingest.prefetch(source_files(data_dir), "cost"):
+        print("costs is up to date")
+        return False
 
     cost_columns = ["treatment", "scenario", "model", "option", "area", "cost"]
-    costs = pd.DataFrame(columns=cost_columns)
 
     # Historical
-    costs = costs.append(
-        get_cost_df(data_dir, luts.historical_year_range, "cru_tx0", "historical", "")
+    parts = get_cost_df(
+        data_dir, luts.historical_year_range, "cru_tx0", "historical", ""
     )
 
     # Future
     for treatment in luts.treatment_options:
         for scenario in luts.scenarios:
             for model in luts.models:
-                costs = costs.append(
-                    get_cost_df(
-                        data_dir, luts.future_year_range, treatment, scenario, model
-                    )
+                parts += get_cost_df(
+                    data_dir, luts.future_year_range, treatment, scenario, model
                 )
 
-    # Compute 5-model averages
+    costs = pd.concat(parts)[cost_columns]
     costs.index.name = "year"
-    for treatment in luts.treatment_options:
-        for scenario in luts.scenarios:
-            for option in luts.fmo_options:
-                tidied = pd.DataFrame(index=luts.future_year_range)
-                tidied.index.name = "year"
-                tidied = tidied.assign(
-                    treatment=treatment,
-                    scenario=scenario,
-                    model="5modelavg",
-                    option=option,
-                )
-                temp_costs_column = (
-                    costs[
-                        (costs.treatment == treatment)
-                        & (costs.scenario == scenario)
-                        & (costs.option == option)
-                    ]
-                    .groupby("year")
-                    .mean()["area"]
-                )
-                tidied["area"] = temp_costs_column
-                tidied["cost"] = tidied.apply(compute_row_cost, axis=1)
-                costs = costs.append(tidied)
-
-    models_with_5modelavg = luts.models.copy()
-    models_with_5modelavg.update({"5modelavg": "5modelavg"})
-
-    for treatment in luts.treatment_options:
-        for scenario in luts.scenarios:
-            for model in models_with_5modelavg:
-                tidied = pd.DataFrame(index=luts.future_year_range)
-                tidied.index.name = "year"
-                tidied = tidied.assign(
-                    treatment=treatment,
-                    scenario=scenario,
-                    model=model,
-                    option="total",
-                )
-                temp_costs_column = (
-                    costs[
-                        (costs.treatment == treatment)
-                        & (costs.scenario == scenario)
-                        & (costs.model == model)
-                    ]
-                    .groupby("year")
-                    .sum(axis=1)
-                )
-                tidied["area"] = temp_costs_column["area"]
-                tidied["cost"] = temp_costs_column["cost"]
-                costs = costs.append(tidied)
+    future = costs[costs.scenario != "historical"]
+
+    # Compute 5-model averages: mean area across models
+    # for each treatment/scenario/option/year.
+    averages = future.groupby(["treatment", "scenario", "option", "year"]).area.mean()
+    averages = averages.reindex(
+        pd.MultiIndex.from_product(
+            [
+                luts.treatment_options,
+                luts.scenarios,
+                luts.fmo_options,
+                luts.future_year_range,
+            ],
+            names=averages.index.names,
+        )
+    )
+    averages = averages.reset_index(["treatment", "scenario", "option"])
+    averages = averages.assign(model=luts.MODEL_AVG)
+    averages["cost"] = compute_cost(averages)
+    costs = pd.concat([costs, averages[cost_columns]])
+
+    # Totals across options, for each model including 5modelavg.
+    models_with_5modelavg = list(luts.models) + [luts.MODEL_AVG]
+    totals = (
+        costs[costs.scenario != "historical"]
+        .groupby(["treatment", "scenario", "model", "year"])[["area", "cost"]]
+        .sum()
+    )
+    totals = totals.reindex(
+        pd.MultiIndex.from_product(
+            [
+                luts.treatment_options,
+                luts.scenarios,
+                models_with_5modelavg,
+                luts.future_year_range,
+            ],
+            names=totals.index.names,
+        )
+    )
+    totals = totals.reset_index(["treatment", "scenario", "model"])
+    totals = totals.assign(option="total")
+    costs = pd.concat([costs, totals[cost_columns]])
 
+    data.categorize(costs)
     costs.to_csv("costs.csv")
     costs.to_pickle("costs.pickle")
+    ingest.record("cost", ["costs.csv", "costs.pickle"])
+    return True
@@ -0,0 +1,305 @@
+"""
+Reading the ALFRESCO source CSVs.
+
+Each source CSV has one row per year and one column per replicate; the
+stages only use the mean across replicates, which reduce_replicates
+computes while streaming each file a row at a time.  Reading and reducing
+the files dominates preprocessing time, so a stage can prefetch all of its
+inputs up front, fanned out over a process pool, and then look each one
+up with replicate_mean as it assembles its tables.
+"""
+# pylint: disable=C0103,import-error
+
+import os
+import csv
+import json
+import hashlib
+from contextlib import contextmanager
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+# Number of worker processes used by prefetch; 1 reads serially.
+# Set from the command line by preprocess.py.
+workers = 1
+
+# Directory holding the build manifest and the cached replicate means
+# of each stage, or None to read every file and rebuild every stage.
+# Set from the command line by preprocess.py.
+cache_dir = None
+
+# Process pool kept open by shared_pool(), for map_files to reuse.
+pool = None
+
+# Replicate means read by prefetch, by filename.
+prefetched = {}
+
+# Input fingerprints of stages prefetched but not yet recorded, by stage.
+pending = {}
+
+
+def row_mean(row):
+    """
+    Mean of a row of replicates, ignoring missing values.  The sum runs
+    in column order like DataFrame.mean(axis=1), so results are the same.
+    """
+    present = ~np.isnan(row)
+    return np.cumsum(row[present])[-1] / present.sum() if present.any() else np.nan
+
+
+# Reductions across the replicates in a row of a source CSV, by name.
+reducers = {
+    "mean": row_mean,
+    "median": np.nanmedian,
+    "min": np.nanmin,
+    "max": np.nanmax,
+    "std": lambda row: np.nanstd(row, ddof=1),
+}
+
+
+def index_name(filename):
+    """ Name of the (year) index column of a source CSV, if any """
+    with open(filename, newline="") as source:
+        return next(csv.reader(source))[0] or None
+
+
+def iter_replicates(filename):
+    """
+    Stream (year, replicate values) for each row of a source CSV.  Blank
+    lines are skipped and years may be written as floats ("2014.0"), as
+    pd.read_csv allowed.
+    """
+    with open(filename, newline="") as source:
+        rows = csv.reader(source)
+        next(rows)
+        for row in rows:
+            if not any(value.strip() for value in row):
+                continue
+            yield int(float(row[0])), np.array(
+                [value or "nan" for value in row[1:]], float
+            )
+
+
+def reduce_replicates(filename, statistics=("mean",)):
+    """
+    Statistics across replicates for each year of a source CSV, as a
+    year-indexed DataFrame with a column per statistic.  Statistics are
+    names in reducers or quantiles as floats (e.g. 0.05).
+
+    The file is streamed a row at a time and each row is reduced as it is
+    read, so memory use is bounded by one row of replicates however many
+    there are.
+    """
+    reduce = [
+        reducers[stat] if isinstance(stat, str) else partial(np.nanquantile, q=stat)
+        for stat in statistics
+    ]
+    years = []
+    values = []
+    for year, replicates in iter_replicates(filename):
+        years.append(year)
+        values.append([func(replicates) for func in reduce])
+    return pd.DataFrame(
+        np.array(values, dtype=float).reshape(len(years), len(statistics)),
+        index=pd.Index(years, dtype=np.int64, name=index_name(filename)),
+        columns=list(statistics),
+    )
+
+
+def read_replicates(filename):
+    """ Year index and a year x replicate array of a source CSV """
+    years, rows = zip(*iter_replicates(filename))
+    return pd.Index(years, dtype=np.int64), np.array(rows)
+
+
+def read_replicate_mean(filename):
+    """ Read a source CSV and return the mean across replicates, per year """
+    return reduce_replicates(filename)["mean"].rename(None)
+
+
+def replicate_mean(filename):
+    """ Mean across replicates of a source CSV, prefetched if possible """
+    if filename in prefetched:
+        return prefetched[filename]
+    return read_replicate_mean(filename)
+
+
+def digest(filename):
+    """ SHA-256 of the contents of a file, as a hex string """
+    sha = hashlib.sha256()
+    with open(filename, "rb") as source:
+        for chunk in iter(lambda: source.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def fingerprint(filename, previous=None):
+    """
+    Size, mtime and content hash of a file.  The hash is copied from
+    previous (an earlier fingerprint) if the size and mtime still match.
+    """
+    stat = os.stat(filename)
+    entry = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+    if previous is not None and all(previous.get(k) == entry[k] for k in entry):
+        entry["sha256"] = previous["sha256"]
+    else:
+        entry["sha256"] = digest(filename)
+    return entry
+
+
+def load_manifest():
+    """ The build manifest, {stage: {"inputs": ..., "outputs": ...}} """
+    path = os.path.join(cache_dir, "manifest.json")
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as manifest_file:
+        return json.load(manifest_file)
+
+
+def save_manifest(manifest):
+    """ Write the build manifest, replacing the old one atomically """
+    path = os.path.join(cache_dir, "manifest.json")
+    with open(path + ".tmp", "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+@contextmanager
+def shared_pool():
+    """
+    Keep one process pool open for the map_files calls in the block, for
+    stages that read their files in many small batches: starting a pool
+    per batch costs more than reading it.
+    """
+    global pool  # pylint: disable=global-statement
+    if workers <= 1 or pool is not None:
+        yield
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pool = executor
+        try:
+            yield
+        finally:
+            pool = None
+
+
+def map_files(func, filenames):
+    """ [func(filename) for filename in filenames], in a process pool if configured """
+    if workers > 1 and len(filenames) > 1:
+        # Chunks small enough to keep every worker busy.
+        chunksize = max(1, min(16, len(filenames) // (workers * 4)))
+        if pool is not None:
+            return list(pool.map(func, filenames, chunksize=chunksize))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(func, filenames, chunksize=chunksize))
+    return [func(filename) for filename in filenames]
+
+
+def prefetch(filenames, stage=None):
+    """
+    Read the replicate means of all existing files in filenames.  With more
+    than one worker, files are read in a process pool; results are merged
+    in the order of filenames, so the output is the same as a serial run.
+
+    If stage is given and a cache directory is set, only files whose
+    contents are not in the stage's cache are read.  Returns whether the
+    stage needs rebuilding; see inputs_changed.
+    """
+    filenames = [filename for filename in filenames if os.path.isfile(filename)]
+    if cache_dir is None or stage is None:
+        prefetched.update(zip(filenames, map_files(read_replicate_mean, filenames)))
+        return True
+
+    changed = inputs_changed(filenames, stage)
+    hashes = [pending[stage][filename]["sha256"] for filename in filenames]
+
+    means = load_cache(stage + ".means")
+    stale = [filename for filename, sha in zip(filenames, hashes) if sha not in means]
+    if stale:
+        print("{}: reading {} changed source files".format(stage, len(stale)))
+        means.update(
+            zip(
+                (pending[stage][filename]["sha256"] for filename in stale),
+                map_files(read_replicate_mean, stale),
+            )
+        )
+    if stale or len(means) != len(set(hashes)):
+        # Keep only the means of the current inputs.
+        save_cache(stage + ".means", {sha: means[sha] for sha in hashes})
+
+    prefetched.update(
+        (filename, means[sha]) for filename, sha in zip(filenames, hashes)
+    )
+    return changed
+
+
+def load_cache(name):
+    """
+    The results cached as name in the cache directory, by content key
+    (e.g. {sha256: replicate means}); empty if there are none yet.
+    """
+    path = os.path.join(cache_dir, name + ".pickle")
+    return pd.read_pickle(path) if os.path.isfile(path) else {}
+
+
+def save_cache(name, results):
+    """ Replace the results cached as name, see load_cache """
+    pd.to_pickle(results, os.path.join(cache_dir, name + ".pickle"))
+
+
+def content_key(stage, filenames, *labels):
+    """
+    Cache key of a result computed from several input files of stage:
+    the labels and the files' content hashes, as fingerprinted by
+    inputs_changed.
+    """
+    return json.dumps(
+        list(labels) + [pending[stage][filename]["sha256"] for filename in filenames]
+    )
+
+
+def inputs_changed(filenames, stage):
+    """
+    Fingerprint the (existing) input files of stage and compare them to
+    the stage's last build in the manifest.  Returns False if the inputs'
+    contents and the outputs are unchanged since then, True if the stage
+    needs rebuilding (always, if no cache directory is set).  The
+    fingerprints are kept for record.
+    """
+    if cache_dir is None:
+        return True
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest = load_manifest().get(stage, {})
+    previous = manifest.get("inputs", {})
+    inputs = {
+        filename: fingerprint(filename, previous.get(filename))
+        for filename in filenames
+        if os.path.isfile(filename)
+    }
+    pending[stage] = inputs
+
+    outputs = manifest.get("outputs", {})
+    current = bool(outputs) and all(
+        os.path.isfile(filename) and fingerprint(filename, entry) == entry
+        for filename, entry in outputs.items()
+    )
+    changed = {name: entry["sha256"] for name, entry in inputs.items()} != {
+        name: entry["sha256"] for name, entry in previous.items()
+    }
+    return changed or not current
+
+
+def record(stage, outputs):
+    """
+    Record a finished build of stage in the manifest: the inputs it
+    prefetched, and the outputs (filenames) it wrote.
+    """
+    if cache_dir is None or stage not in pending:
+        return
+    manifest = load_manifest()
+    manifest[stage] = {
+        "inputs": pending.pop(stage),
+        "outputs": {filename: fingerprint(filename) for filename in outputs},
+    }
+    save_manifest(manifest)
@@ -0,0 +1,81 @@
+"""
+Precompute every figure drawn by the app, for the whole input space
+defined in luts.py, and write them to figures.json.gz in the current
+working directory.  application.py serves figures from this file
+without doing any pandas work at request time.
+
+Run after the area, veg and cost stages, since the figures are built
+from their output.  Figures whose tables are missing (e.g. the replicate
+spread, without the quantiles) are skipped, and built by the app on
+demand instead.  preprocess.py passes the tables its stages rebuilt,
+and only the figures drawn from them (see figures.builder_tables) are
+built again; the others are copied from the existing file.  To refresh
+all of the figures from the existing pickles, run from the repository
+root:
+
+    python preprocess/precompute.py
+"""
+# pylint: disable=C0103,import-error,wrong-import-position
+
+import os
+import sys
+import json
+import time
+
+sys.path.append(".")
+
+from cache import read_precomputed, write_precomputed
+
+
+def process(output="figures.json.gz", tables=None):
+    """
+    Build and write the figures for every valid combination of inputs.
+    With tables, names of the tables that changed, only the figures drawn
+    from them are built, if output already holds the others.
+    """
+    # Imported here so the tables are read after the other stages wrote them.
+    import figures  # pylint: disable=import-outside-toplevel
+
+    start = time.time()
+    count = 0
+
+    # The existing figures, by builder name.
+    previous = {}
+    if tables is not None and os.path.isfile(output):
+        for key, figure in read_precomputed(output).items():
+            previous.setdefault(json.loads(key)[0], {})[key] = figure
+
+    kept = {}
+    rebuilt = []
+    for graph, builder in figures.builders.items():
+        missing = [
+            name
+            for name in figures.builder_tables[graph]
+            if not figures.data.tables[name].available()
+        ]
+        if missing:
+            print("Skipping {}: no {} table".format(graph, ", ".join(missing)))
+        elif builder.__name__ in previous and not set(
+            figures.builder_tables[graph]
+        ).intersection(tables):
+            kept.update(previous[builder.__name__])
+        else:
+            rebuilt.append(builder)
+
+    def all_figures():
+        nonlocal count
+        for builder in rebuilt:
+            for args in figures.input_space(builder):
+                count += 1
+                yield builder.__name__, args, builder(*args)
+
+    write_precomputed(output, all_figures(), kept)
+    print(
+        "Precomputed {} figures in {:.1f}s, kept {} unchanged".format(
+            count, time.time() - start, len(kept)
+        )
+    )
+
+
+if __name__ == "__main__":
+    process()
@@ -0,0 +1,190 @@
+"""
+Replicate quantiles of total area burned.  Produces and writes a file
+in the current working directory, total_area_burned_quantiles.pickle.
+
+The area stage keeps only the mean across replicates; this keeps the
+spread across replicates too, as a table with these columns:
+
+year(index), treatment, scenario, model, region, min, p5, p25, median, p75, p95, max
+
+Quantiles are stored as float32 (km^2).  Statewide (AllFMZs) quantiles
+are of the per-replicate sums over the fire management zones, and
+5modelavg quantiles are of the replicates of all five models pooled.
+Source files are read a treatment and scenario at a time, so only the
+replicates of one set of five models are ever in memory; with several
+workers, all of the reads share one process pool.  The quantiles of each
+such group of runs are cached by the contents of its files (see
+ingest.content_key), so a rerun only reads the groups with changed files.
+"""
+# pylint: disable=C0103,import-error
+
+import numpy as np
+import pandas as pd
+import luts
+import data
+import ingest
+import area
+
+# Quantile columns, and the quantile of the replicates each one holds.
+quantiles = {
+    "min": 0,
+    "p5": 0.05,
+    "p25": 0.25,
+    "median": 0.5,
+    "p75": 0.75,
+    "p95": 0.95,
+    "max": 1,
+}
+
+cols = ["treatment", "scenario", "model", "region"] + list(quantiles)
+
+
+def replicate_quantiles(years, replicates, **dims):
+    """
+    Tidy frame of the quantiles of a year x replicate array,
+    with dimension columns set from dims.
+    """
+    # nanquantile works row by row; only use it if there are missing values.
+    quantile = np.nanquantile if np.isnan(replicates).any() else np.quantile
+    values = quantile(replicates, list(quantiles.values()), axis=1).T
+    t = pd.DataFrame(values.astype(np.float32), index=years, columns=list(quantiles))
+    return t.assign(**dims).reindex(columns=cols)
+
+
+def run_files(data_dir, treatment, prefix, postfix):
+    """ Source filenames of one model run, by region """
+    return {
+        region: area.get_source_filename(
+            data_dir, spatial_prefix, treatment, prefix, postfix, region
+        )
+        for spatial_prefix, regions in luts.spatial_prefix_map.items()
+        for region in regions
+    }
+
+
+def groups(data_dir):
+    """
+    The model runs read by the stage, as (treatment, scenario, runs) with
+    runs a list of (model, filenames by region): the historical run on its
+    own, then the runs of each future treatment and scenario, whose
+    replicates are pooled for 5modelavg.
+    """
+    yield luts.historical_categories[1], None, [
+        (
+            None,
+            run_files(
+                data_dir,
+                luts.historical_categories[1],
+                luts.historical_fmo_prefix,
+                luts.historical_date_postfix,
+            ),
+        )
+    ]
+    for treatment in luts.treatment_options:
+        for scenario in luts.scenarios:
+            yield treatment, scenario, [
+                (
+                    model,
+                    run_files(
+                        data_dir,
+                        treatment,
+                        "_".join([luts.fmo_prefix, scenario, model]),
+                        luts.date_postfix,
+                    ),
+                )
+                for model in luts.models
+            ]
+
+
+def read_model(filenames):
+    """
+    Year index, and year x replicate arrays by region for the files of one
+    model run (see run_files), including statewide totals.
+    """
+    read = ingest.map_files(ingest.read_replicates, list(filenames.values()))
+    years = read[0][0]
+    replicates = {region: values for region, (_, values) in zip(filenames, read)}
+    replicates[luts.STATEWIDE] = np.nansum(
+        [replicates[zone] for zone in luts.zones], axis=0
+    )
+    return years, replicates
+
+
+def read_group(treatment, scenario, runs):
+    """ The quantiles of a group of model runs (see groups) """
+    parts = []
+    pooled = {}
+    for model, filenames in runs:
+        years, replicates = read_model(filenames)
+        # Historical rows have no scenario or model.
+        dims = {"treatment": treatment}
+        if model is not None:
+            dims.update(scenario=scenario, model=model)
+        for region, values in replicates.items():
+            parts.append(replicate_quantiles(years, values, region=region, **dims))
+            pooled.setdefault(region, []).append(values)
+
+    # Future, adding in 5modelavg
+    if scenario is not None:
+        for region, values in pooled.items():
+            parts.append(
+                replicate_quantiles(
+                    years,
+                    np.hstack(values),
+                    treatment=treatment,
+                    scenario=scenario,
+                    model=luts.MODEL_AVG,
+                    region=region,
+                )
+            )
+    return pd.concat(parts)
+
+
+def read_quantiles(data_dir, cache=None):
+    """
+    The quantiles table, from the source files of each model run.  With
+    cache, a dict of the quantiles of each group of runs by content key
+    (see ingest.content_key), only the groups not in it are read; it is
+    updated in place to hold those of the current inputs.
+    """
+    parts = []
+    current = {}
+    for treatment, scenario, runs in groups(data_dir):
+        key = None
+        if cache is not None:
+            filenames = [name for _, files in runs for name in files.values()]
+            key = ingest.content_key("quantiles", filenames, treatment, scenario)
+        if cache is not None and key in cache:
+            current[key] = cache[key]
+        else:
+            current[key] = read_group(treatment, scenario, runs)
+        parts.append(current[key])
+    if cache is not None:
+        stale = len(set(current) - set(cache))
+        if stale:
+            print("quantiles: read {} changed groups of model runs".format(stale))
+        cache.clear()
+        cache.update(current)
+
+    total_area_burned_quantiles = pd.concat(parts)
+    total_area_burned_quantiles.index.name = None
+    return total_area_burned_quantiles
+
+
+def process(data_dir):
+    """ Compute replicate quantiles for every row of total_area_burned """
+    if not ingest.inputs_changed(area.source_files(data_dir), "quantiles"):
+        print("total_area_burned_quantiles is up to date")
+        return False
+
+    # Without a cache directory, every file is read.
+    cache = None if ingest.cache_dir is None else ingest.load_cache("quantiles")
+    with ingest.shared_pool():
+        total_area_burned_quantiles = read_quantiles(data_dir, cache)
+    if cache is not None:
+        ingest.save_cache("quantiles", cache)
+
+    data.categorize(total_area_burned_quantiles)
+    total_area_burned_quantiles.to_pickle("total_area_burned_quantiles.pickle")
+    ingest.record("quantiles", ["total_area_burned_quantiles.pickle"])
+    return True
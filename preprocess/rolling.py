@@ -0,0 +1,34 @@
+"""
+Rolling standard deviations of total area burned, for the inter-annual
+variability chart.  Reads total_area_burned.pickle and writes
+total_area_burned_rolling_std.pickle in the current working directory.
+
+The table is keyed like total_area_burned, with a std_<window> column
+for each of luts.rolling_windows: the standard deviation over a window
+of that many years centered on each year, NaN where it doesn't fit.
+See data.rolling_std, which the app also uses to compute the table from
+total_area_burned.pickle when this one hasn't been written.
+
+Run after the area stage.  To rebuild it from the existing pickle,
+run from the repository root:
+
+    python preprocess/rolling.py
+"""
+# pylint: disable=C0103,import-error,wrong-import-position
+
+import sys
+import pandas as pd
+
+sys.path.append(".")
+
+import data
+
+
+def process():
+    """ Compute the rolling std of every series in total_area_burned """
+    rolling_std = data.rolling_std(pd.read_pickle("total_area_burned.pickle"))
+    rolling_std.to_pickle("total_area_burned_rolling_std.pickle")
+
+
+if __name__ == "__main__":
+    process()
@@ -0,0 +1,200 @@
+"""
+Generate a synthetic ALFRESCO source data directory: every file the area,
+veg and cost stages read, at the paths they expect, filled with random
+replicate values.  Useful for timing preprocessing without the real data.
+
+The tree can be scaled past the real data, for load testing: more (or
+fewer) replicates per file, a longer span of years, and more (or fewer)
+regions and models.  Regions and models are what luts.py lists, so
+scale() changes its lookup tables in place to match; only the synthetic
+data tools call it, never the app.  The parameters are saved in the tree
+as synthetic.json, and apply() (called by preprocess.py --synthetic, the
+benchmarks and the load test) sets up the same tables for a later run.
+
+From the repository root:
+
+    python preprocess/synthetic.py <data_dir> [--replicates N]
+        [--regions N] [--models N] [--first-year YEAR] [--last-year YEAR]
+"""
+# pylint: disable=C0103,import-error,wrong-import-position
+
+import os
+import sys
+import json
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.append("./preprocess")
+sys.path.append(".")
+
+import luts
+
+# Saved in the generated tree, holding the parameters of scale().
+spec_filename = "synthetic.json"
+
+
+def scaled(table, count, key_format, label_format):
+    """
+    The first count entries of a lookup table, padded with synthetic
+    ones named from the format strings and their number.
+    """
+    entries = list(table.items())[:count]
+    for number in range(len(entries) + 1, count + 1):
+        entries.append((key_format.format(number), label_format.format(number)))
+    return dict(entries)
+
+
+def scale(regions=None, models=None, first_year=None, last_year=None):
+    """
+    Change the lookup tables in luts, in place, to have regions regions
+    (fire management zones and ecoregions, in the proportions of luts.py)
+    and models models, and historical years from first_year and future
+    years to last_year.
+    The historical and future years still meet where they do in luts.
+    Parameters left as None are unchanged.
+    """
+    if regions is not None:
+        # At least one zone: the full model extent is the sum of the zones.
+        zone_count = max(
+            1,
+            round(regions * len(luts.zones) / (len(luts.zones) + len(luts.ecoregions))),
+        )
+        zones = scaled(luts.zones, zone_count, "SyntheticZone{}", "Synthetic Zone {}")
+        ecoregions = scaled(
+            luts.ecoregions,
+            regions - zone_count,
+            "SyntheticEcoregion{}",
+            "Synthetic Ecoregion {}",
+        )
+        for table, entries in [(luts.zones, zones), (luts.ecoregions, ecoregions)]:
+            table.clear()
+            table.update(entries)
+        luts.regions.clear()
+        luts.regions.update({**luts.zones, **luts.ecoregions})
+        luts.regions[luts.STATEWIDE] = "Full Model Extent"
+        luts.categories["region"] = list(luts.regions)
+
+    if models is not None:
+        entries = scaled(luts.models, models, "SyntheticModel{}", "Synthetic Model {}")
+        luts.models.clear()
+        luts.models.update(entries)
+        luts.categories["model"] = [""] + list(luts.models) + [luts.MODEL_AVG]
+
+    split = luts.future_year_range.start
+    if first_year is not None:
+        luts.historical_year_range = pd.RangeIndex(start=first_year, stop=split)
+    if last_year is not None:
+        luts.future_year_range = pd.RangeIndex(start=split, stop=last_year + 1)
+
+
+def apply(data_dir):
+    """
+    If data_dir holds a synthetic tree, scale the lookup tables to match
+    it.  Returns the tree's parameters, or None for real data.  Call
+    before importing the stages (cost.py maps years at import).
+    """
+    path = os.path.join(data_dir, spec_filename)
+    if not os.path.isfile(path):
+        return None
+    with open(path) as spec_file:
+        spec = json.load(spec_file)
+    scale(
+        **{
+            name: spec[name]
+            for name in ["regions", "models", "first_year", "last_year"]
+        }
+    )
+    return spec
+
+
+def generate(data_dir, replicates=8, seed=luts.random_seed, stages=None, **scaling):
+    """
+    Write a CSV of random replicates for each source file of stages
+    (default: area, veg and cost), after scaling the lookup tables with
+    any keyword arguments of scale().
+    """
+    scale(**scaling)
+    if stages is None:
+        # After scaling: cost.py maps years to cost factors at import.
+        import area  # pylint: disable=import-outside-toplevel
+        import veg  # pylint: disable=import-outside-toplevel
+        import cost  # pylint: disable=import-outside-toplevel
+
+        stages = [area, veg, cost]
+
+    rng = np.random.default_rng(seed)
+    columns = ["rep_" + str(replicate) for replicate in range(replicates)]
+    filenames = [
+        filename for stage in stages for filename in stage.source_files(data_dir)
+    ]
+    for filename in filenames:
+        if luts.historical_fmo_prefix in filename:
+            years = luts.historical_year_range
+        else:
+            years = luts.future_year_range
+        values = rng.gamma(0.5, 200, (len(years), replicates)).round(3)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        pd.DataFrame(values, index=years, columns=columns).to_csv(filename)
+
+    spec = {
+        "replicates": replicates,
+        "seed": seed,
+        "regions": len(luts.zones) + len(luts.ecoregions),
+        "models": len(luts.models),
+        "first_year": luts.historical_year_range[0],
+        "last_year": luts.future_year_range[-1],
+        "files": len(filenames),
+    }
+    with open(os.path.join(data_dir, spec_filename), "w") as spec_file:
+        json.dump({name: int(value) for name, value in spec.items()}, spec_file)
+    return spec
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("data_dir")
+    parser.add_argument(
+        "--replicates", type=int, default=8, help="per file (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--regions",
+        type=int,
+        help="zones and ecoregions (default: those in luts.py, {})".format(
+            len(luts.zones) + len(luts.ecoregions)
+        ),
+    )
+    parser.add_argument(
+        "--models",
+        type=int,
+        help="models (default: those in luts.py, {})".format(len(luts.models)),
+    )
+    parser.add_argument(
+        "--first-year",
+        type=int,
+        help="first historical year (default: {})".format(
+            luts.historical_year_range[0]
+        ),
+    )
+    parser.add_argument(
+        "--last-year",
+        type=int,
+        help="last future year (default: {})".format(luts.future_year_range[-1]),
+    )
+    parser.add_argument("--seed", type=int, default=luts.random_seed)
+    args = parser.parse_args()
+    written = generate(
+        args.data_dir,
+        replicates=args.replicates,
+        seed=args.seed,
+        regions=args.regions,
+        models=args.models,
+        first_year=args.first_year,
+        last_year=args.last_year,
+    )
+    print(
+        "Wrote {files} files: {regions} regions, {models} models, "
+        "{first_year}-{last_year}, {replicates} replicates".format(**written)
+    )
@@ -7,8 +7,11 @@ year (index), treatment, scenario, RCP, Region, DeciduousArea, ConiferousArea
 # pylint: disable=invalid-name,import-error
 
 import os
+import numpy as np
 import pandas as pd
 import luts
+import data
+import ingest
 
 forest_types = ["Deciduous", "BlackSpruce", "WhiteSpruce"]
 veg_columns = ["treatment", "scenario", "model", "region", "deciduous", "coniferous"]
@@ -81,8 +84,7 @@ def get_tidied_veg_count_df(
     )
 
     if os.path.isfile(deciduous_filename):
-        deciduous = pd.read_csv(deciduous_filename, index_col=0)
-        tidied = tidied.assign(deciduous=deciduous.mean(axis=1))
+        tidied = tidied.assign(deciduous=ingest.replicate_mean(deciduous_filename))
     else:
         print_vegcount_log(
             "NO DECIDUOUS found", spatial_prefix, treatment, scenario, model, region
@@ -91,10 +93,9 @@ def get_tidied_veg_count_df(
     # Handle cases where either black or white spruce
     # may be missing in data
     if os.path.isfile(white_spruce_filename) and os.path.isfile(black_spruce_filename):
-        white_spruce = pd.read_csv(white_spruce_filename, index_col=0)
-        black_spruce = pd.read_csv(black_spruce_filename, index_col=0)
         tidied = tidied.assign(
-            coniferous=white_spruce.mean(axis=1) + black_spruce.mean(axis=1)
+            coniferous=ingest.replicate_mean(white_spruce_filename)
+            + ingest.replicate_mean(black_spruce_filename)
         )
     elif os.path.isfile(white_spruce_filename):
         print_vegcount_log(
@@ -105,8 +106,7 @@ def get_tidied_veg_count_df(
             model,
             region,
         )
-        white_spruce = pd.read_csv(white_spruce_filename, index_col=0)
-        tidied = tidied.assign(coniferous=white_spruce.mean(axis=1))
+        tidied = tidied.assign(coniferous=ingest.replicate_mean(white_spruce_filename))
     elif os.path.isfile(black_spruce_filename):
         print_vegcount_log(
             "Only BLACK spruce found",
@@ -116,8 +116,7 @@ def get_tidied_veg_count_df(
             model,
             region,
         )
-        black_spruce = pd.read_csv(black_spruce_filename, index_col=0)
-        tidied = tidied.assign(coniferous=black_spruce.mean(axis=1))
+        tidied = tidied.assign(coniferous=ingest.replicate_mean(black_spruce_filename))
     else:
         print_vegcount_log(
             "NEITHER black or white spruce found",
@@ -132,8 +131,33 @@ def get_tidied_veg_count_df(
     return tidied
 
 
+def source_files(data_dir):
+    """
+    All source files process may read, in the order they are read.
+    Not all of these exist; see get_tidied_veg_count_df.
+    """
+    for spatial_prefix, regions in luts.spatial_prefix_map.items():
+        combinations = [("cru_tx0", "historical", "", region) for region in regions]
+        combinations += [
+            (treatment, scenario, model, region)
+            for treatment in luts.treatment_options
+            for scenario in luts.scenarios
+            for model in luts.models
+            for region in regions
+        ]
+        for treatment, scenario, model, region in combinations:
+            for forest in ["Deciduous", "WhiteSpruce", "BlackSpruce"]:
+                yield get_veg_filename(
+                    data_dir, spatial_prefix, treatment, scenario, model, region, forest
+                )
+
+
 def process(data_dir):
     """ Read source files and produce combined veg count tidied df """
+    if not ingest.prefetch(source_files(data_dir), "veg"):
+        print("veg_counts is up to date")
+        return False
+
     # Read and combine
     veg_counts = pd.DataFrame(columns=veg_columns)
     temp_veg_dfs = []
@@ -174,77 +198,67 @@ def process(data_dir):
     veg_counts = pd.concat(temp_veg_dfs)
     veg_counts.index.name = "year"
 
-    # Compute 5-model averages
-    temp_veg_dfs = []
-    for spatial_prefix, regions in luts.spatial_prefix_map.items():
-        for treatment in luts.treatment_options:
-            for scenario in luts.scenarios:
-                for region in regions:
-                    tidied = pd.DataFrame(index=luts.future_year_range)
-                    tidied = tidied.assign(
-                        treatment=treatment,
-                        scenario=scenario,
-                        model=luts.MODEL_AVG,
-                        region=region,
-                    )
-                    tidied["deciduous"] = (
-                        veg_counts[
-                            (veg_counts.treatment == treatment)
-                            & (veg_counts.scenario == scenario)
-                            & (veg_counts.region == region)
-                        ]
-                        .groupby("year")
-                        .median()["deciduous"]
-                    )
-                    tidied["coniferous"] = (
-                        veg_counts[
-                            (veg_counts.treatment == treatment)
-                            & (veg_counts.scenario == scenario)
-                            & (veg_counts.region == region)
-                        ]
-                        .groupby("year")
-                        .median()["coniferous"]
-                    )
-                    temp_veg_dfs.append(tidied)
-
-    veg_counts = veg_counts.append(temp_veg_dfs)
-
-    models_with_statewide = luts.models.copy()
-    models_with_statewide.update({luts.MODEL_AVG: luts.MODEL_AVG})
-
-    # Statewide sums -- all FMZs
-    tidied = pd.DataFrame(index=luts.historical_year_range)
-    tidied = tidied.assign(
-        treatment="cru_tx0", scenario="historical", model="", region=luts.STATEWIDE
+    # Compute 5-model averages (medians), both forest types in one pass,
+    # then put them in spatial prefix/treatment/scenario/region order.
+    forests = ["deciduous", "coniferous"]
+    future = veg_counts[veg_counts.scenario != "historical"]
+    medians = future.groupby(["treatment", "scenario", "region", "year"])[
+        forests
+    ].median()
+    medians = medians.reindex(
+        pd.MultiIndex.from_tuples(
+            [
+                (treatment, scenario, region, year)
+                for regions in luts.spatial_prefix_map.values()
+                for treatment in luts.treatment_options
+                for scenario in luts.scenarios
+                for region in regions
+                for year in luts.future_year_range
+            ],
+            names=medians.index.names,
+        )
     )
-    t = veg_counts.loc[veg_counts["region"].isin(luts.zones)]
-    for year in luts.historical_year_range:
-        tidied.at[year, "deciduous"] = t.loc[year].sum()["deciduous"]
-        tidied.at[year, "coniferous"] = t.loc[year].sum()["coniferous"]
-
-    veg_counts = veg_counts.append(tidied)
-
-    for treatment in luts.treatment_options:
-        for scenario in luts.scenarios:
-            for model in models_with_statewide:
-                tidied = pd.DataFrame(index=luts.future_year_range)
-                tidied = tidied.assign(
-                    treatment=treatment,
-                    scenario=scenario,
-                    model=model,
-                    region=luts.STATEWIDE,
-                )
-                t = veg_counts.loc[
-                    (veg_counts["region"].isin(luts.zones))
-                    & (veg_counts["treatment"] == treatment)
-                    & (veg_counts["scenario"] == scenario)
-                    & (veg_counts["model"] == model)
-                ]
-                for year in luts.future_year_range:
-                    tidied.at[year, "deciduous"] = t.loc[year].sum()["deciduous"]
-                    tidied.at[year, "coniferous"] = t.loc[year].sum()["coniferous"]
+    medians = medians.reset_index(["treatment", "scenario", "region"])
+    medians = medians.assign(model=luts.MODEL_AVG)[veg_columns]
+    medians.index.name = None
+
+    veg_counts = pd.concat([veg_counts, medians])
+
+    # Statewide sums -- all FMZs.  Pivot to a frame with a column per
+    # forest type and FMZ, then sum the FMZs for each forest type.  Rows
+    # are summed as contiguous arrays, which adds the FMZs in the same
+    # order (and so to the same floats) as summing each year's rows did.
+    zones = veg_counts[veg_counts.region.isin(luts.zones)]
+    zones = zones.set_index(["treatment", "scenario", "model", "region"], append=True)
+    zones = zones[forests].unstack("region")
+    sums = pd.DataFrame(
+        {
+            forest: np.ascontiguousarray(
+                zones[forest].reindex(columns=list(luts.zones)).fillna(0).to_numpy()
+            ).sum(axis=1)
+            for forest in forests
+        },
+        index=zones.index,
+    )
+    sums = sums.reorder_levels(["treatment", "scenario", "model", None])
+
+    models_with_statewide = list(luts.models) + [luts.MODEL_AVG]
+    keys = [("cru_tx0", "historical", "", year) for year in luts.historical_year_range]
+    keys += [
+        (treatment, scenario, model, year)
+        for treatment in luts.treatment_options
+        for scenario in luts.scenarios
+        for model in models_with_statewide
+        for year in luts.future_year_range
+    ]
+    statewide = sums.reindex(pd.MultiIndex.from_tuples(keys, names=sums.index.names))
+    statewide = statewide.reset_index(["treatment", "scenario", "model"])
+    statewide = statewide.assign(region=luts.STATEWIDE)[veg_columns]
 
-                veg_counts = veg_counts.append(tidied)
+    veg_counts = pd.concat([veg_counts, statewide])
 
+    data.categorize(veg_counts)
     veg_counts.to_pickle("./veg_counts.pickle")
     veg_counts.to_csv("./veg_counts.csv")
+    ingest.record("veg", ["veg_counts.pickle", "veg_counts.csv"])
+    return True
@@ -0,0 +1,133 @@
+# pylint: disable=C0103,E0401
+"""
+Cache of serialized, precompressed callback responses for the Flask
+server behind the Dash app.
+
+Even with the figures themselves cached (see cache.py), Dash serializes
+the figure to JSON on every callback response, and the response is then
+compressed again.  A ResponseCache keeps the final response body for each
+callback and set of input values, along with its gzip (and, if the brotli
+package is installed, brotli) compressed forms, and answers repeated
+callback requests with the stored bytes in the best encoding the client
+accepts.  Nothing about a figure is recomputed for a cached response.
+
+Given a SharedCache (see cache.py), responses are also stored there, and
+responses missing from the in-process cache are looked up there, so
+server workers reuse the responses that any of them have built.
+
+"""
+import gzip
+import json
+from flask import Response, g, request
+from cache import FigureCache, normalize_args
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Encodings stored for each response, best first.
+encodings = (["br"] if brotli is not None else []) + ["gzip"]
+
+
+def callback_key(body, partial=None):
+    """
+    Key for a Dash callback request body: the callback's output, and the
+    values of its inputs and state (normalized as for the figure cache).
+    With partial, a set of input ids ("id.property"), also whether those
+    are exactly the inputs that changed, for callbacks that then return
+    a partial response.
+    """
+    values = [item.get("value") for item in body.get("inputs", [])]
+    values += [item.get("value") for item in body.get("state", [])]
+    key = [body.get("output")] + [
+        list(arg) if isinstance(arg, tuple) else arg for arg in normalize_args(values)
+    ]
+    if partial is not None:
+        key.append(set(body.get("changedPropIds") or []) == partial)
+    return json.dumps(key)
+
+
+def compress(body):
+    """ The body of a response in each of the stored encodings """
+    compressed = {"identity": body, "gzip": gzip.compress(body, 9)}
+    if brotli is not None:
+        compressed["br"] = brotli.compress(body)
+    return compressed
+
+
+class ResponseCache:
+    """
+    Serve Dash callback responses (POSTs to _dash-update-component) from
+    a bounded cache of precompressed bodies.  Install on the Flask server
+    with init_app.
+    """
+
+    def __init__(self, max_entries=2048, max_bytes=None, shared=None):
+        self.cache = FigureCache(max_entries=max_entries, max_bytes=max_bytes)
+        self.shared = shared
+        # The inputs, by output (callback id), whose change alone gets a
+        # partial response from the callback, see callback_key.
+        self.partial_outputs = {}
+
+    def init_app(self, server):
+        """ Register the request hooks on a Flask server """
+        server.before_request(self.before_request)
+        server.after_request(self.after_request)
+
+    def stats(self):
+        """ Counters for monitoring """
+        return self.cache.stats()
+
+    @staticmethod
+    def respond(compressed):
+        """ A response with the best stored encoding the client accepts """
+        encoding = next(
+            (enc for enc in encodings if request.accept_encodings[enc] > 0),
+            "identity",
+        )
+        response = Response(compressed[encoding], mimetype="application/json")
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+        response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+    def before_request(self):
+        """ Answer a callback request from the cache, if possible """
+        if request.method != "POST" or not request.path.endswith(
+            "_dash-update-component"
+        ):
+            return None
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            return None
+        key = callback_key(body, self.partial_outputs.get(body.get("output")))
+        compressed = self.cache.get(key)
+        if compressed is None and self.shared is not None:
+            compressed = self.shared.get(key)
+            if compressed is not None:
+                self.store(key, compressed)
+        if compressed is None:
+            g.response_cache_key = key
+            return None
+        return self.respond(compressed)
+
+    def store(self, key, compressed):
+        """ Keep a response in the in-process cache """
+        self.cache.put(key, compressed, size=sum(map(len, compressed.values())))
+
+    def after_request(self, response):
+        """ Store and compress a callback response built by Dash """
+        key = g.pop("response_cache_key", None)
+        if (
+            key is None
+            or response.status_code != 200
+            or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+        ):
+            return response
+        compressed = compress(response.get_data())
+        self.store(key, compressed)
+        if self.shared is not None:
+            self.shared.put(key, compressed)
+        return self.respond(compressed)
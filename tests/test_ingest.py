@@ -0,0 +1,51 @@
+"""
+preprocess/ingest.py reading source CSVs a row at a time, against
+pd.read_csv, which the stages used to read them with.
+
+From the repository root:
+
+    python -m pytest tests
+"""
+# pylint: disable=C0103,import-error,wrong-import-position
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [root, os.path.join(root, "preprocess")]
+
+import ingest
+
+# Replicates as the ALFRESCO outputs write them: the year, then one
+# column per replicate, with missing values left empty.
+source = """\
+,0,1,2
+2014,1.5,2.5,
+2015.0,3.0,4.0,5.0
+
+2016,0.25,,0.75
+"""
+
+
+def write_source(tmp_path, text):
+    path = tmp_path / "source.csv"
+    path.write_text(text)
+    return str(path)
+
+
+def test_blank_lines_and_float_years(tmp_path):
+    filename = write_source(tmp_path, source + "\n\n")
+    rows = list(ingest.iter_replicates(filename))
+    assert [year for year, _ in rows] == [2014, 2015, 2016]
+    assert all(isinstance(year, int) for year, _ in rows)
+    np.testing.assert_array_equal(rows[0][1], [1.5, 2.5, np.nan])
+
+
+def test_matches_read_csv(tmp_path):
+    filename = write_source(tmp_path, source + "\n")
+    frame = pd.read_csv(filename, index_col=0)
+    means = ingest.read_replicate_mean(filename)
+    assert means.index.tolist() == [int(year) for year in frame.index]
+    np.testing.assert_allclose(means.to_numpy(), frame.mean(axis=1).to_numpy())
@@ -0,0 +1,55 @@
+"""
+luts.to_acres_array against the scalar luts.to_acres it vectorizes.
+
+From the repository root:
+
+    python -m pytest tests
+"""
+# pylint: disable=C0103,import-error,wrong-import-position
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import luts
+
+# Square km, including values whose acres are exactly half-way between
+# integers (50 -> 12355.5, 150 -> 37066.5), which round to even.
+km2 = [0.0, 0.001, 1.0, 2.5, 12.345, 50.0, 150.0, 250.0, 987.654, 7292.61, np.nan]
+
+
+def test_scalars():
+    for value in km2:
+        acres = luts.to_acres_array(value)
+        assert isinstance(acres, int)
+        assert acres == luts.to_acres(value)
+
+
+def test_ndarray():
+    acres = luts.to_acres_array(np.array(km2))
+    assert isinstance(acres, np.ndarray)
+    assert acres.tolist() == [luts.to_acres(value) for value in km2]
+
+
+def test_series_keeps_index():
+    series = pd.Series(km2, index=range(2000, 2000 + len(km2)), name="area")
+    acres = luts.to_acres_array(series)
+    assert isinstance(acres, pd.Series)
+    assert acres.index.equals(series.index)
+    assert acres.name == "area"
+    assert acres.tolist() == [luts.to_acres(value) for value in km2]
+
+
+def test_nan_is_zero():
+    assert luts.to_acres_array(np.nan) == 0
+    assert luts.to_acres_array(np.array([np.nan, np.nan])).tolist() == [0, 0]
+
+
+def test_ties_round_to_even():
+    assert 50.0 * luts.ACRES_PER_KM2 == 12355.5
+    assert 150.0 * luts.ACRES_PER_KM2 == 37066.5
+    assert luts.to_acres_array(np.array([50.0, 150.0])).tolist() == [12356, 37066]
+    assert [luts.to_acres(50.0), luts.to_acres(150.0)] == [12356, 37066]